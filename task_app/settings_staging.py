@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tasks.middleware.LargeResponseGZipMiddleware',
+    'tasks.middleware.TaskMemoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,6 +90,8 @@ DATABASES = {
     },
 }
 
+DATABASE_ROUTERS = ['tasks.routers.TaskShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -126,3 +130,29 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Tasks app
+
+# Serve read-only pages and API calls from the in-process snapshot of the task forest.
+TASKS_SNAPSHOT = False
+
+# Seconds between refreshes of the snapshot, requests in between read it as it is.
+TASKS_SNAPSHOT_REFRESH = 1
+
+# Seconds for which changes are read again by the changes API and the snapshot,
+# so rows of transactions committed after a read are not missed.
+TASKS_SYNC_WINDOW = 60
+
+# Seconds after which the status stream picks up edited tasks.
+TASKS_STATUS_STREAM_REFRESH = 5
+
+# Responses of at least this number of bytes are gzipped for clients accepting it.
+TASKS_GZIP_MIN_LENGTH = 1024
+
+# Aliases of DATABASES holding trees of tasks, e.g. ['shard0', 'shard1'].
+# Empty list keeps all tasks in the default database.
+TASKS_SHARDS = []
+
+# Number of task ids reserved at once by every process when sharding is on.
+TASKS_ID_BLOCK_SIZE = 100
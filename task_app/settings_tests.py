@@ -1,4 +1,4 @@
-from .settings import *
+from .settings_staging import *
 
 DATABASES = {
     'default': {
@@ -6,4 +6,13 @@ DATABASES = {
         'NAME': os.path.join(BASE_DIR, 'db_test.sqlite3'),
 
     },
-}
\ No newline at end of file
+    # shards used by tests of ``tasks.sharding``, TASKS_SHARDS stays empty
+    'shard0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'shard0_test.sqlite3'),
+    },
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'shard1_test.sqlite3'),
+    },
+}
@@ -1,7 +1,114 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .memo import prefetch_subtrees
 from .models import Task, Owner
+from .snapshot import get_snapshot, snapshot_enabled
 
 
-admin.site.register(Task)
-admin.site.register(Owner)
+class EstimatedCountPaginator(Paginator):
+    """Paginator reading the number of rows of large, unfiltered tables from the database statistics.
 
+    Exact COUNT(*) is used for filtered querysets, small tables
+    and databases without the statistics (e.g. SQLite before ANALYZE).
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimated_count()
+        if estimate is None or estimate < self.estimate_threshold:
+            return super().count
+        return estimate
+
+    def estimated_count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return None
+
+        connection = connections[self.object_list.db]
+        table = self.object_list.model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+                if cursor.fetchone() is None:
+                    return None
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+        # sqlite_stat1 keeps the number of rows as the first of space-separated numbers
+        return int(str(row[0]).split()[0])
+
+
+class TaskChangeList(ChangeList):
+
+    def get_results(self, request):
+        """Prepares calculated columns of the page of tasks, so they need no queries per row.
+
+        Snapshot nodes are attached to the tasks when the snapshot is enabled,
+        otherwise only subtrees of the page are read into the request's memo.
+        """
+        super().get_results(request)
+        if snapshot_enabled():
+            snapshot = get_snapshot()
+            for task in self.result_list:
+                task.snapshot_node = snapshot.get(task.id)
+        else:
+            prefetch_subtrees(self.result_list)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'name',
+        'owner',
+        'parent',
+        'priority',
+        'start_date',
+        'end_date',
+        'status',
+        'net_duration',
+    )
+    list_select_related = ('owner', 'parent')
+    list_filter = ('priority',)
+    search_fields = ('name',)
+    ordering = ('-id',)
+    raw_id_fields = ('parent',)
+    autocomplete_fields = ('owner',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return TaskChangeList
+
+    def status(self, task):
+        if task.start_date is None or task.end_date is None:
+            return None
+        return self.calculated(task).status
+    status.short_description = "Status"
+
+    def net_duration(self, task):
+        if task.start_date is None or task.end_date is None:
+            return None
+        return self.calculated(task).net_duration
+    net_duration.short_description = "Net duration"
+
+    @staticmethod
+    def calculated(task):
+        """Returns snapshot node of the task, or the task itself when it has none."""
+        return getattr(task, 'snapshot_node', None) or task
+
+
+@admin.register(Owner)
+class OwnerAdmin(admin.ModelAdmin):
+    search_fields = ('name', 'surname')
+    ordering = ('surname', 'name')
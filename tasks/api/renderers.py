@@ -0,0 +1,95 @@
+"""Compact renderers of serialized tasks.
+
+Both renderers lay serializer output out by columns: every field is a list
+of values, nested objects (e.g. ``owner``) are replaced with indexes into
+a de-duplicated lookup table and date-times with epoch seconds.
+
+``ColumnarJSONRenderer`` writes this layout as JSON (``?format=columnar``),
+``MessagePackRenderer`` as MessagePack (``?format=msgpack``) and is
+available only when the optional ``msgpack`` package is installed.
+"""
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from django.utils.dateparse import parse_datetime
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def to_columnar(data):
+    """Returns columnar layout of serializer output, other data (e.g. errors) is returned unchanged.
+
+    Returns:
+        table(dict): ``count`` of rows, ``columns`` with list of values by field name
+            and ``lookups`` with list of distinct nested objects by field name
+    """
+    serializer = getattr(data, 'serializer', None)
+    if serializer is None:
+        return data
+
+    if isinstance(serializer, serializers.ListSerializer):
+        fields = serializer.child.fields
+        rows = data
+    else:
+        fields = serializer.fields
+        rows = [data]
+
+    datetime_fields = {name for name, field in fields.items() if isinstance(field, serializers.DateTimeField)}
+    nested_fields = {name for name, field in fields.items() if isinstance(field, serializers.BaseSerializer)}
+
+    # the same moments repeat a lot (e.g. rolled up dates of parents), so each is parsed once
+    timestamps = {}
+    columns = {name: [] for name in fields}
+    lookups = {name: [] for name in nested_fields}
+    indexes = {name: {} for name in nested_fields}
+    for row in rows:
+        for name, value in row.items():
+            if value is None:
+                pass
+            elif name in datetime_fields:
+                timestamp = timestamps.get(value)
+                if timestamp is None:
+                    timestamp = timestamps[value] = int(parse_datetime(value).timestamp())
+                value = timestamp
+            elif name in nested_fields:
+                key = tuple(value.items())
+                index = indexes[name].get(key)
+                if index is None:
+                    index = indexes[name][key] = len(lookups[name])
+                    lookups[name].append(value)
+                value = index
+            columns[name].append(value)
+
+    return {
+        'count': len(rows),
+        'columns': columns,
+        'lookups': lookups,
+    }
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.tasks.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(to_columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(to_columnar(data), use_bin_type=True)
+
+
+TASK_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [ColumnarJSONRenderer]
+if msgpack is not None:
+    TASK_RENDERER_CLASSES.append(MessagePackRenderer)
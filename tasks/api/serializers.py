@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from ..models import Task, Owner
+from ..models import ArchivedTask, Task, Owner
 
 
 class OwnerSerializer(serializers.ModelSerializer):
@@ -29,3 +29,29 @@ class TaskSerializer(serializers.ModelSerializer):
         )
 
 
+class ArchivedTaskSerializer(TaskSerializer):
+
+    class Meta(TaskSerializer.Meta):
+        model = ArchivedTask
+
+
+class TaskChangeSerializer(TaskSerializer):
+
+    class Meta(TaskSerializer.Meta):
+        fields = TaskSerializer.Meta.fields + (
+            'parent',
+            'order_key',
+            'modified',
+        )
+
+
+class TaskMoveSerializer(serializers.Serializer):
+    """Id of the sibling task to move the task after or before, at the end without any."""
+
+    after = serializers.IntegerField(required=False)
+    before = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if 'after' in data and 'before' in data:
+            raise serializers.ValidationError("Give either after or before sibling.")
+        return data
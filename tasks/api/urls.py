@@ -1,12 +1,18 @@
 from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
-from .views import TaskList, TaskDetail
+from .views import TaskList, TaskDetail, TaskMove, TaskChanges, status_stream
 
 
 urlpatterns = [
     path('', TaskList.as_view()),
     path('task/<int:pk>/', TaskDetail.as_view()),
+    path('task/<int:pk>/move/', TaskMove.as_view()),
+    path('changes/', TaskChanges.as_view()),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
 
+urlpatterns += [
+    path('statuses/stream/', status_stream),
+]
+
@@ -1,14 +1,181 @@
+import json
+import queue
+from datetime import datetime, timedelta
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import generics
-from ..models import Task
-from .serializers import TaskSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from ..models import ArchivedTask, Task, TaskDeletion
+from ..sharding import fan_out, fan_out_get, fan_out_list, sharding_enabled
+from ..snapshot import get_snapshot, snapshot_enabled, sync_window
+from ..status_events import scheduler
+from .renderers import TASK_RENDERER_CLASSES
+from .serializers import ArchivedTaskSerializer, TaskChangeSerializer, TaskMoveSerializer, TaskSerializer
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# seconds between comments keeping idle event streams open
+KEEPALIVE_INTERVAL = 15
+
+
+def archived_requested(request):
+    """Returns True for GET requests asking for archived tasks with ``?archived=true``."""
+    return request.method == 'GET' and request.query_params.get('archived') in ('1', 'true')
+
+
+def datetime_to_cursor(value):
+    """Returns sync cursor: number of microseconds since the epoch, as a string."""
+    return str((value - EPOCH) // timedelta(microseconds=1))
+
+
+def cursor_to_datetime(cursor):
+    try:
+        return EPOCH + timedelta(microseconds=int(cursor))
+    except (TypeError, ValueError, OverflowError):
+        raise ValidationError({'since': "Invalid cursor."})
 
 
 class TaskList(generics.ListCreateAPIView):
+    """Lists active tasks, or archived ones with ``?archived=true``."""
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
+    renderer_classes = TASK_RENDERER_CLASSES
+
+    def get_queryset(self):
+        if archived_requested(self.request):
+            return fan_out_list(ArchivedTask.objects.select_related('owner'))
+        if snapshot_enabled() and self.request.method == 'GET':
+            return get_snapshot().all()
+        return fan_out_list(super().get_queryset())
+
+    def get_serializer_class(self):
+        if archived_requested(self.request):
+            return ArchivedTaskSerializer
+        return super().get_serializer_class()
 
 
 class TaskDetail(generics.RetrieveAPIView):
+    """Returns an active task, or an archived one with ``?archived=true``."""
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
+    renderer_classes = TASK_RENDERER_CLASSES
+
+    def get_queryset(self):
+        if archived_requested(self.request):
+            return ArchivedTask.objects.select_related('owner')
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        if archived_requested(self.request):
+            return ArchivedTaskSerializer
+        return super().get_serializer_class()
+
+    def get_object(self):
+        if snapshot_enabled() and not archived_requested(self.request):
+            node = get_snapshot().get(self.kwargs['pk'])
+            if node is None:
+                raise Http404
+            return node
+
+        if not sharding_enabled():
+            return super().get_object()
+
+        try:
+            task = fan_out_get(self.get_queryset(), pk=self.kwargs['pk'])
+        except ObjectDoesNotExist:
+            raise Http404
+        self.check_object_permissions(self.request, task)
+        return task
+
+
+class TaskMove(generics.GenericAPIView):
+    """Moves a task among sub tasks of its parent, see ``Task.move``.
+
+    Accepts ``{"after": <sibling id>}`` or ``{"before": <sibling id>}``,
+    an empty body moves the task to the end. Returns the moved task.
+    """
+    queryset = Task.objects.all()
+    serializer_class = TaskMoveSerializer
+
+    def post(self, request, *args, **kwargs):
+        try:
+            task = fan_out_get(self.get_queryset(), pk=self.kwargs['pk'])
+        except ObjectDoesNotExist:
+            raise Http404
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        siblings = self.get_queryset().using(task._state.db).filter(parent_id=task.parent_id)
+        neighbours = {}
+        for position, sibling_id in serializer.validated_data.items():
+            try:
+                neighbours[position] = siblings.exclude(id=task.id).get(id=sibling_id)
+            except ObjectDoesNotExist:
+                raise ValidationError({position: "Task {} is not a sibling.".format(sibling_id)})
+
+        task.move(**neighbours)
+        return Response(TaskChangeSerializer(task).data)
+
+
+class TaskChanges(generics.GenericAPIView):
+    """Returns tasks created or modified and ids of tasks deleted since the ``since`` cursor.
+
+    Without ``since`` all tasks are returned. Every response contains a new ``cursor``
+    to be sent with the next request. Rows become visible when their transaction commits,
+    later than their ``modified`` or ``deleted`` time, so the cursor lags behind the read
+    by ``TASKS_SYNC_WINDOW`` seconds. Changes are returned again until they are older
+    than the window, clients should apply them idempotently.
+    """
+    queryset = Task.objects.select_related('owner')
+    serializer_class = TaskChangeSerializer
+
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since')
+        # taken before reading, so rows saved during this request are sent next time
+        cursor = timezone.now() - sync_window()
+
+        changed = self.get_queryset()
+        deleted = []
+        if since is not None:
+            since = cursor_to_datetime(since)
+            changed = changed.filter(modified__gte=since)
+            tombstones = TaskDeletion.objects.filter(deleted__gte=since).values_list('task_id', flat=True)
+            deleted = [
+                task_id
+                for task_ids in fan_out(lambda alias: list(tombstones.using(alias)))
+                for task_id in task_ids
+            ]
+
+        return Response({
+            'cursor': datetime_to_cursor(cursor),
+            'changed': self.get_serializer(fan_out_list(changed), many=True).data,
+            'deleted': deleted,
+        })
+
+
+def status_stream(request):
+    """Server-sent events stream of task status changes.
+
+    Every ``status`` event carries a JSON list of ``{"id": ..., "status": ...}``
+    objects of tasks, including parents, whose status has just changed.
+    """
+    def stream():
+        # subscribed once streaming starts, a response closed before it leaves no queue behind
+        events = scheduler.subscribe()
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    changes = events.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield "event: status\ndata: {}\n\n".format(json.dumps(changes))
+        finally:
+            scheduler.unsubscribe(events)
 
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
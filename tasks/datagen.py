@@ -0,0 +1,73 @@
+"""Generated task forests for load tests and benchmarks."""
+import random
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Max
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+
+from .models import Owner, Task, ORDER_GAP, PRIORITY_CHOICES
+from .rollups import compute_rollups
+
+
+@contextmanager
+def scratch_database():
+    """Runs the block against a new, migrated test database, destroyed afterwards."""
+    old_config = setup_databases(verbosity=0, interactive=False, aliases=['default'])
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+def generate_forest(roots, depth, fanout, owners=10, seed=None):
+    """Creates ``roots`` trees, where every parent has ``fanout`` sub tasks ``depth`` levels down.
+
+    Tasks are inserted with bulk_create level by level and start_date/end_date
+    of parents are rolled up afterwards.
+
+    Returns:
+        ids(list): ids of all created tasks
+    """
+    generator = random.Random(seed)
+    priorities = [choice for choice, _ in PRIORITY_CHOICES]
+    now = timezone.now()
+
+    with transaction.atomic():
+        first_owner_id = (Owner.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        Owner.objects.bulk_create(
+            Owner(id=first_owner_id + number, name="Owner", surname=str(number))
+            for number in range(owners)
+        )
+
+        next_id = (Task.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        level = [None] * roots
+        created = []
+        for height in range(depth + 1):
+            tasks = []
+            for order, parent_id in enumerate(level):
+                start_date = now + timezone.timedelta(hours=generator.randint(-24 * 30, 24 * 30))
+                tasks.append(Task(
+                    id=next_id,
+                    parent_id=parent_id,
+                    order_key=((order % fanout if parent_id else order) + 1) * ORDER_GAP,
+                    name="Task {}".format(next_id),
+                    owner_id=first_owner_id + generator.randrange(owners) if owners else None,
+                    priority=generator.choice(priorities),
+                    start_date=start_date,
+                    end_date=start_date + timezone.timedelta(hours=generator.randint(1, 24 * 7)),
+                ))
+                next_id += 1
+            Task.objects.bulk_create(tasks, batch_size=500)
+            created.extend(tasks)
+            level = [task.id for task in tasks for _ in range(fanout)] if height < depth else []
+
+        changes = compute_rollups([(task.id, task.parent_id, task.start_date, task.end_date) for task in created])
+        Task.objects.bulk_update(
+            [Task(id=task_id, start_date=start_date, end_date=end_date)
+             for task_id, _, _, start_date, end_date in changes],
+            ['start_date', 'end_date'],
+            batch_size=500,
+        )
+    return [task.id for task in created]
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...models import Task
+from ...sharding import task_databases
+
+
+class Command(BaseCommand):
+    help = "Moves trees of tasks whose every task is Complete to the archive table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=0, metavar='DAYS',
+            help="Archive only trees completed at least this number of days ago.",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Print ids of root tasks which would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timezone.timedelta(days=options['older_than'])
+        archived = []
+        for alias in task_databases():
+            roots = Task.objects.using(alias).completed_roots(before).order_by('id')
+            if options['dry_run']:
+                archived.extend(roots.archivable_roots(before))
+            else:
+                archived.extend(roots.archive(before))
+
+        if options['dry_run']:
+            self.stdout.write("Trees which would be archived: {}".format(
+                ", ".join(str(root_id) for root_id in sorted(archived)) or "none"
+            ))
+            return
+
+        self.stdout.write("Archived {} trees.".format(len(archived)))
@@ -0,0 +1,58 @@
+import gzip
+import time
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from ...api.renderers import ColumnarJSONRenderer, MessagePackRenderer, msgpack
+from ...api.serializers import TaskSerializer
+from ...datagen import generate_forest, scratch_database
+from ...models import Task
+
+
+class Command(BaseCommand):
+    help = "Compares size and encode time of the task list rendered by the available API renderers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10, help="Number of timed renders of every renderer.")
+        parser.add_argument('--roots', type=int, default=100, help="Number of generated trees.")
+        parser.add_argument('--depth', type=int, default=3, help="Depth of generated trees.")
+        parser.add_argument('--fanout', type=int, default=3, help="Number of sub tasks of every generated parent.")
+        parser.add_argument('--seed', type=int, default=None, help="Seed of generated data.")
+        parser.add_argument(
+            '--existing', action='store_true',
+            help="Render tasks of the configured database instead of a generated scratch database.",
+        )
+
+    def handle(self, *args, **options):
+        renderers = [JSONRenderer(), ColumnarJSONRenderer()]
+        if msgpack is not None:
+            renderers.append(MessagePackRenderer())
+        else:
+            self.stdout.write("msgpack is not installed, MessagePack renderer is skipped.")
+
+        with ExitStack() as stack:
+            if not options['existing']:
+                stack.enter_context(scratch_database())
+                generate_forest(options['roots'], options['depth'], options['fanout'], seed=options['seed'])
+            data = TaskSerializer(Task.objects.select_related('owner'), many=True).data
+
+        self.stdout.write("{} tasks, best of {} runs".format(len(data), options['repeat']))
+        self.stdout.write("{:<10} {:>12} {:>12} {:>11} {:>9}".format(
+            "format", "bytes", "gzip bytes", "encode ms", "gzip ms"
+        ))
+        for renderer in renderers:
+            encode_time = gzip_time = float('inf')
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                content = renderer.render(data)
+                encode_time = min(encode_time, time.perf_counter() - started)
+
+                started = time.perf_counter()
+                compressed = gzip.compress(content, compresslevel=6)
+                gzip_time = min(gzip_time, time.perf_counter() - started)
+
+            self.stdout.write("{:<10} {:>12} {:>12} {:>11.2f} {:>9.2f}".format(
+                renderer.format, len(content), len(compressed), encode_time * 1000, gzip_time * 1000
+            ))
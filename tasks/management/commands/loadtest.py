@@ -0,0 +1,160 @@
+import math
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ...datagen import generate_forest, scratch_database
+from ...models import Task
+
+
+DEFAULT_MIX = (
+    '/=1',
+    '/api/=2',
+    '/api/task/{pk}/=7',
+)
+
+
+def percentile(sorted_values, percent):
+    """Returns nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def parse_mix(mix):
+    """Returns (path patterns, weights) from ``PATH=WEIGHT`` strings."""
+    paths, weights = [], []
+    for item in mix:
+        path, _, weight = item.rpartition('=')
+        try:
+            weights.append(float(weight))
+        except ValueError:
+            raise CommandError("Invalid request mix item: {}".format(item))
+        paths.append(path)
+    return paths, weights
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Sends a mix of requests to the WSGI application from a pool of threads and reports latency percentiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mix', action='append', metavar='PATH=WEIGHT',
+            help="Requested path, optionally with a query string, and its weight, may be repeated. "
+                 "{pk} in the path is replaced with a random task id. "
+                 "Default: " + ' '.join(DEFAULT_MIX),
+        )
+        parser.add_argument('--requests', type=int, default=1000, help="Number of requests.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Number of threads sending requests.")
+        parser.add_argument('--roots', type=int, default=20, help="Number of generated trees.")
+        parser.add_argument('--depth', type=int, default=3, help="Depth of generated trees.")
+        parser.add_argument('--fanout', type=int, default=3, help="Number of sub tasks of every generated parent.")
+        parser.add_argument('--host', default='localhost', help="Host header, must be in ALLOWED_HOSTS.")
+        parser.add_argument('--seed', type=int, default=None, help="Seed of generated data and of the request mix.")
+        parser.add_argument(
+            '--existing', action='store_true',
+            help="Use tasks of the configured database instead of a generated scratch database.",
+        )
+
+    def handle(self, *args, **options):
+        from task_app.wsgi import application
+
+        paths, weights = parse_mix(options['mix'] or DEFAULT_MIX)
+
+        with ExitStack() as stack:
+            if options['existing']:
+                task_ids = list(Task.objects.values_list('id', flat=True))
+            else:
+                stack.enter_context(scratch_database())
+                task_ids = generate_forest(
+                    options['roots'], options['depth'], options['fanout'], seed=options['seed']
+                )
+            if not task_ids:
+                raise CommandError("There are no tasks to request.")
+
+            generator = random.Random(options['seed'])
+            plan = [
+                (pattern, pattern.format(pk=generator.choice(task_ids)))
+                for pattern in generator.choices(paths, weights, k=options['requests'])
+            ]
+
+            started = time.perf_counter()
+            if options['concurrency'] <= 1:
+                results = [self.call(application, options['host'], *request) for request in plan]
+            else:
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                    results = list(executor.map(
+                        lambda request: self.call(application, options['host'], *request), plan
+                    ))
+            elapsed = time.perf_counter() - started
+
+        self.report(results, elapsed, len(task_ids))
+
+    @staticmethod
+    def call(application, host, pattern, path):
+        """Sends one GET request to the application.
+
+        Returns:
+            result(tuple): path pattern, HTTP status code, latency in seconds, number of SQL queries
+        """
+        url = urlsplit(path)
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'HTTP_HOST': host,
+        }
+        setup_testing_defaults(environ)
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split()[0]))
+
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = application(environ, start_response)
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+        return pattern, statuses[0], time.perf_counter() - started, queries.count
+
+    def report(self, results, elapsed, tasks):
+        by_pattern = defaultdict(list)
+        for result in results:
+            by_pattern[result[0]].append(result)
+
+        self.stdout.write("{} requests to {} tasks in {:.2f} s, {:.1f} req/s".format(
+            len(results), tasks, elapsed, len(results) / elapsed
+        ))
+        self.stdout.write("{:<24} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}".format(
+            "endpoint", "requests", "errors", "p50 ms", "p95 ms", "p99 ms", "queries"
+        ))
+        for pattern, pattern_results in sorted(by_pattern.items()):
+            latencies = sorted(result[2] * 1000 for result in pattern_results)
+            errors = sum(1 for result in pattern_results if result[1] >= 400)
+            queries = sum(result[3] for result in pattern_results) / len(pattern_results)
+            self.stdout.write("{:<24} {:>8} {:>7} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.1f}".format(
+                pattern, len(pattern_results), errors,
+                percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99), queries
+            ))
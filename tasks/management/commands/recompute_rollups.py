@@ -0,0 +1,119 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from ...models import IN_BATCH_SIZE, Task
+from ...rollups import ROLLUP_FIELDS, chunked, compute_rollups
+from ...sharding import task_databases
+
+
+def load_trees(root_ids, using):
+    """Returns rollup rows of whole trees of given roots, read level by level."""
+    rows = []
+    level = list(root_ids)
+    queryset = Task.objects.using(using).order_by().values_list(*ROLLUP_FIELDS)
+    for batch in chunked(level, IN_BATCH_SIZE):
+        rows.extend(queryset.filter(id__in=batch))
+
+    while level:
+        next_level = []
+        for batch in chunked(level, IN_BATCH_SIZE):
+            subtasks = list(queryset.filter(parent_id__in=batch))
+            rows.extend(subtasks)
+            next_level.extend(row[0] for row in subtasks)
+        level = next_level
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Recomputes start_date and end_date of parent tasks from their sub tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help="Number of worker processes, 1 computes rollups in the main process.",
+        )
+        parser.add_argument(
+            '--roots', type=int, nargs='+', metavar='ID',
+            help="Ids of root tasks to recompute, all trees by default.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=200,
+            help="Number of trees sent to a worker at once.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of rows written by a single UPDATE.",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Print differences without writing them.",
+        )
+
+    def handle(self, *args, **options):
+        changes = []
+        trees = 0
+        for alias in task_databases():
+            roots = Task.objects.using(alias).filter(parent=None).order_by('id')
+            if options['roots']:
+                roots = roots.filter(id__in=options['roots'])
+            root_ids = list(roots.values_list('id', flat=True))
+            trees += len(root_ids)
+
+            chunks = (load_trees(chunk, alias) for chunk in chunked(root_ids, options['chunk_size']))
+            database_changes = []
+            for chunk_changes in self.compute(chunks, options['workers']):
+                database_changes.extend(chunk_changes)
+
+            if not options['dry_run']:
+                self.write(database_changes, options['batch_size'], alias)
+            changes.extend(database_changes)
+
+        if options['dry_run']:
+            for task_id, old_start, old_end, new_start, new_end in changes:
+                self.stdout.write("Task {}: start_date {} -> {}, end_date {} -> {}".format(
+                    task_id, old_start, new_start, old_end, new_end
+                ))
+            self.stdout.write("{} tasks in {} trees would be updated.".format(len(changes), trees))
+            return
+
+        self.stdout.write("Updated {} tasks in {} trees.".format(len(changes), trees))
+
+    @staticmethod
+    def compute(chunks, workers):
+        """Yields rollup changes of every chunk, computed in a pool of worker processes."""
+        if workers <= 1:
+            for rows in chunks:
+                yield compute_rollups(rows)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for rows in chunks:
+                pending.add(executor.submit(compute_rollups, rows))
+                # keep only a few chunks in memory at once
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in pending:
+                yield future.result()
+
+    @staticmethod
+    def write(changes, batch_size, using):
+        """Writes new values with batched UPDATE statements.
+
+        ``modified`` is set explicitly, because ``bulk_update`` skips ``auto_now`` fields
+        and readers of ``Task.modified`` have to see the change.
+        """
+        modified = timezone.now()
+        for batch in chunked(changes, batch_size):
+            tasks = [
+                Task(id=task_id, start_date=start_date, end_date=end_date, modified=modified)
+                for task_id, _, _, start_date, end_date in batch
+            ]
+            with transaction.atomic(using=using):
+                Task.objects.using(using).bulk_update(tasks, ['start_date', 'end_date', 'modified'])
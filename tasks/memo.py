@@ -0,0 +1,138 @@
+"""Memoization of computed properties of ``Task`` instances within one unit of work.
+
+Inside ``task_memo()`` (every request, with ``tasks.middleware.TaskMemoMiddleware``)
+sub tasks of a task are read once, and ``has_children``, ``status`` and
+``net_duration`` of every task are computed once, from memoized results
+of its sub tasks.
+
+Memoized values are dropped for saved or deleted tasks and their ancestors.
+Changes made outside of the ORM (e.g. ``QuerySet.update``) have to be followed
+by ``invalidate_task_memo()``.
+"""
+import threading
+from contextlib import contextmanager
+
+from .models import IN_BATCH_SIZE, Task
+
+
+class TaskMemo:
+    """Sub tasks and computed values of tasks, keyed by task id."""
+
+    def __init__(self):
+        self._children = {}
+        self._parents = {}
+        self._values = {}
+
+    def children(self, task):
+        """Returns list of direct sub tasks of the task, read from the database once."""
+        children = self._children.get(task.pk)
+        if children is None:
+            children = self.add_children(task, list(task.subtasks.all()))
+        return children
+
+    def add_children(self, task, children):
+        for child in children:
+            # {{ task.parent }} of a sub task doesn't need a query
+            Task.parent.field.set_cached_value(child, task)
+            self._parents[child.pk] = task.pk
+        self._children[task.pk] = children
+        return children
+
+    def get(self, task, name, compute):
+        """Returns the memoized ``name`` value of the task, calling ``compute()`` when missing."""
+        values = self._values.setdefault(task.pk, {})
+        if name not in values:
+            values[name] = compute()
+        return values[name]
+
+    def invalidate(self, task=None):
+        """Drops memoized values of the task and all its ancestors, or everything without a task."""
+        if task is None:
+            self._children.clear()
+            self._parents.clear()
+            self._values.clear()
+            return
+
+        task_ids = {task.pk}
+        for task_id in (self._parents.get(task.pk), task.parent_id):
+            while task_id is not None and task_id not in task_ids:
+                task_ids.add(task_id)
+                task_id = self._parents.get(task_id)
+
+        for task_id in task_ids:
+            self._values.pop(task_id, None)
+        # the task may have moved to another parent, or have been deleted
+        for task_id in (self._parents.pop(task.pk, None), task.parent_id):
+            self._children.pop(task_id, None)
+
+    def prefetch(self, tasks):
+        """Reads sub tasks of all levels of given tasks, one query per level (and batch of ids)."""
+        level = [task for task in tasks if task.pk not in self._children]
+        while level:
+            by_id = {task.pk: task for task in level}
+            children = {task.pk: [] for task in level}
+            parent_ids = list(by_id)
+            using = level[0]._state.db
+            for index in range(0, len(parent_ids), IN_BATCH_SIZE):
+                # default ordering of tasks keeps the order of siblings
+                for child in Task.objects.using(using).filter(
+                        parent_id__in=parent_ids[index:index + IN_BATCH_SIZE]):
+                    children[child.parent_id].append(child)
+
+            level = []
+            for task_id, subtasks in children.items():
+                self.add_children(by_id[task_id], subtasks)
+                level.extend(subtasks)
+
+
+_local = threading.local()
+
+
+def current_memo():
+    """Returns ``TaskMemo`` of the current unit of work, or None outside of it."""
+    return getattr(_local, 'memo', None)
+
+
+@contextmanager
+def task_memo():
+    """Shares computed properties of tasks within the block.
+
+    Nested blocks share the memo of the outermost one.
+    """
+    memo = current_memo()
+    if memo is not None:
+        yield memo
+        return
+
+    _local.memo = memo = TaskMemo()
+    try:
+        yield memo
+    finally:
+        _local.memo = None
+
+
+def invalidate_task_memo(task=None):
+    """Drops memoized values of the task and its ancestors (all values without a task)."""
+    memo = current_memo()
+    if memo is not None:
+        memo.invalidate(task)
+
+
+def prefetch_subtrees(tasks):
+    """Reads whole subtrees of the tasks into the current memo.
+
+    Tasks of every database (shard) are read separately.
+
+    Returns:
+        tasks(list): given tasks
+    """
+    tasks = list(tasks)
+    memo = current_memo()
+    if memo is not None:
+        by_database = {}
+        for task in tasks:
+            by_database.setdefault(task._state.db, []).append(task)
+        for database_tasks in by_database.values():
+            memo.prefetch(database_tasks)
+    return tasks
+
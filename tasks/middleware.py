@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+from .memo import task_memo
+
+
+class LargeResponseGZipMiddleware(GZipMiddleware):
+    """Compresses only responses bigger than ``TASKS_GZIP_MIN_LENGTH`` bytes.
+
+    Small responses aren't worth the CPU time, and streaming responses
+    (e.g. the status event stream) have to reach clients chunk by chunk.
+    """
+
+    def process_response(self, request, response):
+        min_length = getattr(settings, 'TASKS_GZIP_MIN_LENGTH', 1024)
+        if response.streaming or len(response.content) < min_length:
+            return response
+        return super().process_response(request, response)
+
+
+class TaskMemoMiddleware:
+    """Runs every request in its own unit of work, see ``tasks.memo.task_memo``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with task_memo():
+            return self.get_response(request)
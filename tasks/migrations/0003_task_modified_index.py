@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2026-10-19 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0002_auto_20190906_1219'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.13 on 2026-10-19 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_task_modified_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskDeletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.IntegerField()),
+                ('deleted', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.13 on 2026-10-19 06:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_taskdeletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('priority', models.CharField(choices=[('L', 'Low'), ('N', 'Normal'), ('U', 'Urgent')], default='N', max_length=1, null=True)),
+                ('name', models.CharField(max_length=120)),
+                ('start_date', models.DateTimeField(null=True)),
+                ('end_date', models.DateTimeField(null=True)),
+                ('order', models.IntegerField(default=0, help_text='Position of the task among sub tasks of the parent.')),
+                ('created', models.DateTimeField()),
+                ('modified', models.DateTimeField()),
+                ('archived', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_tasks', to='tasks.Owner')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subtasks', to='tasks.ArchivedTask')),
+            ],
+            options={
+                'ordering': ('parent_id', 'order', 'id'),
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.13 on 2026-10-19 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0005_archivedtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskIdSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_id', models.BigIntegerField()),
+            ],
+        ),
+    ]
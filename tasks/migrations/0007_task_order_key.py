@@ -0,0 +1,54 @@
+from django.db import migrations, models
+
+ORDER_GAP = 1024
+
+
+def order_to_order_key(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    Task.objects.using(schema_editor.connection.alias).update(
+        order_key=(models.F('_order') + 1) * ORDER_GAP,
+    )
+
+
+def order_key_to_order(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    db_alias = schema_editor.connection.alias
+    parent_ids = Task.objects.using(db_alias).order_by().values_list('parent_id', flat=True).distinct()
+    for parent_id in parent_ids:
+        subtasks = Task.objects.using(db_alias).filter(parent_id=parent_id).order_by('order_key', 'id')
+        for order, task in enumerate(subtasks):
+            Task.objects.using(db_alias).filter(id=task.id).update(_order=order)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_taskidsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='order_key',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Position of the task among sub tasks of the parent, with gaps between siblings.'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(order_to_order_key, order_key_to_order),
+        migrations.AlterOrderWithRespectTo(
+            name='task',
+            order_with_respect_to=None,
+        ),
+        migrations.AlterModelOptions(
+            name='task',
+            options={'ordering': ('order_key', 'id')},
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['parent', 'order_key'], name='tasks_task_parent_order_idx'),
+        ),
+        migrations.AlterField(
+            model_name='archivedtask',
+            name='order',
+            field=models.BigIntegerField(default=0, help_text='Position of the task among sub tasks of the parent.'),
+        ),
+    ]
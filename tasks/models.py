@@ -1,7 +1,9 @@
 from collections import Counter
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
+from django.db.models import Max, Min
+from django.db.models.query import ModelIterable
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 
@@ -26,6 +28,58 @@ PRIORITY_CHOICES = (
     ('U', 'Urgent'),
 )
 
+# SQLite accepts at most 999 variables in a single statement
+IN_BATCH_SIZE = 500
+
+# distance between order_key values of consecutive sibling tasks, see ``Task.move``
+ORDER_GAP = 1024
+# the smallest distance left after spreading keys of siblings out again
+MIN_ORDER_GAP = ORDER_GAP // 16
+
+
+def node_status_flag(start_date, end_date, current):
+    """Returns status flag of a node_task at the given moment."""
+    if current < start_date:
+        return SCHEDULED
+    elif current > end_date:
+        return COMPLETE
+    return RUNNING
+
+
+def parent_status_flag(statuses_counter):
+    """Returns status flag of a parent task.
+
+    Args:
+        statuses_counter(container.Counter): status's flags of all node_tasks of the parent.
+
+    Returns:
+        status(str): str flag of the status
+    """
+    # if all sub-tasks has status complete:
+    if statuses_counter[COMPLETE] and not (
+        statuses_counter[RUNNING] or
+        statuses_counter[SCHEDULED]
+    ):
+        return COMPLETE
+
+    # if all sub-tasks has status scheduled
+    elif statuses_counter[SCHEDULED] and not (
+        statuses_counter[RUNNING] or
+        statuses_counter[COMPLETE]
+    ):
+        return SCHEDULED
+
+    # if exactly one sub-task is running
+    elif statuses_counter[RUNNING] == 1:
+        return RUNNING
+
+    # if more then one sub-task is running
+    elif statuses_counter[RUNNING] > 1:
+        return MULTI_RUNS
+
+    else:
+        return IDLE
+
 
 class Owner(models.Model):
     name = models.CharField(
@@ -38,6 +92,10 @@ class Owner(models.Model):
         null=False,
         blank=False
     )
+    modified = models.DateTimeField(
+        auto_now=True,
+        editable=False,
+    )
 
     def __str__(self):
         return "{} {}".format(
@@ -46,6 +104,108 @@ class Owner(models.Model):
         )
 
 
+def tree_is_complete(levels, before):
+    """Returns True when every node_task of the tree (levels of tasks) ended before the given moment.
+
+    Node_tasks without end_date are not complete, neither is a tree without tasks.
+    """
+    parent_ids = {task.parent_id for level in levels for task in level}
+    return bool(levels) and all(
+        task.end_date is not None and task.end_date < before
+        for level in levels for task in level
+        if task.id not in parent_ids
+    )
+
+
+class TaskQuerySet(models.QuerySet):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._with_subtrees = False
+
+    def with_subtrees(self):
+        """Reads whole subtrees of the tasks into the current ``tasks.memo.TaskMemo``
+        when the queryset is evaluated, one query per level of the trees.
+        """
+        clone = self._chain()
+        clone._with_subtrees = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_subtrees = self._with_subtrees
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        # values() and values_list() rows aren't tasks, there is nothing to prefetch for
+        if self._with_subtrees and not fetched and self._iterable_class is ModelIterable:
+            from .memo import prefetch_subtrees
+
+            prefetch_subtrees(self._result_cache)
+
+    def completed_roots(self, before=None):
+        """Returns root tasks which ended before the given moment (now by default).
+
+        Rolled up end_date of a root is the latest end_date in its tree,
+        so the whole tree of every returned root is Complete.
+        """
+        return self.filter(
+            parent=None,
+            end_date__lt=before or timezone.now(),
+        )
+
+    def subtree_levels(self, root_ids):
+        """Returns list of levels (lists of tasks) of the trees of given roots, roots are the first level."""
+        levels = []
+        level = list(self.filter(id__in=root_ids))
+        while level:
+            levels.append(level)
+            parent_ids = [task.id for task in level]
+            level = []
+            for index in range(0, len(parent_ids), IN_BATCH_SIZE):
+                level.extend(self.filter(parent_id__in=parent_ids[index:index + IN_BATCH_SIZE]))
+        return levels
+
+    def archivable_roots(self, before=None):
+        """Returns ids of root tasks of the queryset which ``archive`` would move,
+        the trees are checked in the same way.
+        """
+        before = before or timezone.now()
+        return [
+            root_id
+            for root_id in self.filter(parent=None).values_list('id', flat=True)
+            if tree_is_complete(Task.objects.using(self.db).subtree_levels([root_id]), before)
+        ]
+
+    def archive(self, before=None):
+        """Moves whole trees of root tasks of the queryset to the ``ArchivedTask`` table.
+
+        Trees with any node_task not complete before the given moment (now by default)
+        are left as they are.
+
+        Returns:
+            archived(list): ids of archived root tasks
+        """
+        before = before or timezone.now()
+        archived = []
+        for root_id in self.filter(parent=None).values_list('id', flat=True):
+            with transaction.atomic(using=self.db):
+                levels = Task.objects.using(self.db).subtree_levels([root_id])
+                if not tree_is_complete(levels, before):
+                    continue
+
+                for level in levels:
+                    ArchivedTask.objects.using(self.db).bulk_create(
+                        [ArchivedTask.from_task(task) for task in level],
+                        batch_size=IN_BATCH_SIZE,
+                    )
+                Task.objects.using(self.db).filter(id=root_id).delete()
+                archived.append(root_id)
+        return archived
+
+
 class Task(models.Model):
     owner = models.ForeignKey(
         Owner,
@@ -89,24 +249,167 @@ class Task(models.Model):
     modified = models.DateTimeField(
         auto_now=True,
         editable=False,
+        db_index=True,
+    )
+    order_key = models.BigIntegerField(
+        editable=False,
+        help_text="Position of the task among sub tasks of the parent, with gaps between siblings.",
     )
 
+    objects = TaskQuerySet.as_manager()
+
     def __str__(self):
         return "{} ({})".format(self.name,
                                 self.id)
 
     class Meta:
-        order_with_respect_to = 'parent'
+        ordering = ('order_key', 'id')
+        indexes = [
+            models.Index(fields=['parent', 'order_key'], name='tasks_task_parent_order_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Saves tasks to the shard of their tree, when sharding is on.
+
+        The default database is replaced with the shard of the tree,
+        other databases given with ``using`` are respected. A saved task put under
+        a parent in another shard, or made a root of a tree of another shard,
+        is moved there together with its descendants, see ``tasks.sharding.move_tree``.
+        New tasks without ``order_key`` become the last sub task of the parent.
+        """
+        from .sharding import allocate_task_id, move_tree, shard_for_task, sharding_enabled
+
+        if self._state.adding and sharding_enabled():
+            if self.pk is None:
+                self.pk = allocate_task_id()
+                kwargs['force_insert'] = True
+            if kwargs.get('using') in (None, DEFAULT_DB_ALIAS):
+                kwargs['using'] = shard_for_task(self)
+        elif sharding_enabled() and self._state.db and kwargs.get('using') in (None, DEFAULT_DB_ALIAS, self._state.db):
+            kwargs['using'] = shard_for_task(self)
+            if kwargs['using'] != self._state.db:
+                with transaction.atomic(using=self._state.db), transaction.atomic(using=kwargs['using']):
+                    move_tree(self, kwargs['using'])
+                    super().save(*args, **kwargs)
+                return
+        if self._state.adding and self.order_key is None:
+            last_key = self.__siblings(
+                kwargs.get('using') or router.db_for_write(Task, instance=self)
+            ).aggregate(Max('order_key'))['order_key__max']
+            self.order_key = ORDER_GAP if last_key is None else last_key + ORDER_GAP
+        super().save(*args, **kwargs)
+
+    def __siblings(self, using):
+        return Task.objects.using(using).filter(parent_id=self.parent_id).exclude(id=self.id)
+
+    def move(self, after=None, before=None):
+        """Moves the task among sub tasks of its parent.
+
+        The task is put right after the ``after`` sibling, right before the ``before``
+        sibling or, without any of them, at the end. Only the row of the task is updated,
+        unless there is no gap left between order_key values of the new neighbours: then
+        keys of the task and a few following siblings are spread out again.
+
+        Returns:
+            order_key(int): new order_key of the task
+        """
+        if after is not None and before is not None:
+            raise ValueError("Task can be moved either after or before a sibling.")
+        sibling = after if after is not None else before
+        if sibling is not None and (sibling.parent_id != self.parent_id or sibling.pk == self.pk):
+            raise ValueError("Task can be moved only next to its siblings.")
+
+        siblings = self.__siblings(self._state.db)
+        keys = siblings.values_list('order_key', flat=True)
+        if before is not None:
+            high = keys.get(id=before.pk)
+            low = keys.filter(order_key__lt=high).order_by('-order_key').first()
+        elif after is not None:
+            low = keys.get(id=after.pk)
+            high = keys.filter(order_key__gt=low).order_by('order_key').first()
+        else:
+            low = keys.order_by('-order_key').first()
+            high = None
+
+        if low is None and high is None:
+            order_key = ORDER_GAP
+        elif high is None:
+            order_key = low + ORDER_GAP
+        elif low is None:
+            order_key = high - ORDER_GAP
+        elif high - low > 1:
+            order_key = (low + high) // 2
+        else:
+            return self.__spread_order_keys(siblings, low)
+
+        self.modified = timezone.now()
+        self.order_key = order_key
+        Task.objects.using(self._state.db).filter(id=self.id).update(
+            order_key=self.order_key,
+            modified=self.modified,
+        )
+        self.__order_changed()
+        return self.order_key
+
+    def __spread_order_keys(self, siblings, low):
+        """Puts the task right after the sibling with ``low`` order_key, when there is no gap after it.
+
+        Following siblings are renumbered only until a sibling far enough from ``low``
+        to leave gaps of at least ``MIN_ORDER_GAP``.
+        """
+        task_ids = [self.id]
+        high = None
+        for sibling_id, order_key in siblings.filter(order_key__gt=low).order_by(
+                'order_key', 'id').values_list('id', 'order_key').iterator():
+            if order_key - low >= (len(task_ids) + 1) * MIN_ORDER_GAP:
+                high = order_key
+                break
+            task_ids.append(sibling_id)
+
+        gap = ORDER_GAP if high is None else (high - low) // (len(task_ids) + 1)
+        self.modified = timezone.now()
+        Task.objects.using(self._state.db).bulk_update(
+            [Task(id=task_id, order_key=low + gap * (index + 1), modified=self.modified)
+             for index, task_id in enumerate(task_ids)],
+            ['order_key', 'modified'],
+            batch_size=IN_BATCH_SIZE,
+        )
+        self.order_key = low + gap
+        self.__order_changed()
+        return self.order_key
+
+    def __order_changed(self):
+        from .memo import invalidate_task_memo
+
+        invalidate_task_memo(self)
 
     @property
     def has_children(self):
         """Returns number of children node_task objects. """
-        return self.subtasks.all().count()
+        from .memo import current_memo
+
+        memo = current_memo()
+        if memo is None:
+            return self.subtasks.all().count()
+        return len(memo.children(self))
+
+    @property
+    def children(self):
+        """Returns direct sub tasks of the task, memoized within ``tasks.memo.task_memo``."""
+        from .memo import current_memo
+
+        memo = current_memo()
+        if memo is None:
+            return self.subtasks.all()
+        return memo.children(self)
 
     @property
     def status(self):
         """Returns human-friendly name of the task status. Calculated property."""
-        return TASK_STATUS_MAPPER[self.__status()]
+        from .memo import task_memo
+
+        with task_memo():
+            return TASK_STATUS_MAPPER[self.__status()]
 
     def __status(self):
         """Returns the flag of the task's status.
@@ -125,58 +428,39 @@ class Task(models.Model):
         Returns:
             status(str): str flag of the status
         """
+        from .memo import current_memo
+
+        return current_memo().get(self, 'status', self.__compute_status)
+
+    def __compute_status(self):
         if not self.has_children:
             return self.__node_task_status()
         return self.__parent_task_status()
 
     def __node_task_status(self):
         """Returns status of node_task. Private method."""
-        current = timezone.now()
-        if current < self.start_date:
-            return SCHEDULED
-        elif current > self.end_date:
-            return COMPLETE
-        return RUNNING
+        return node_status_flag(self.start_date, self.end_date, timezone.now())
 
     def __parent_task_status(self):
         """Returns status of parent node. Private method."""
-        statuses_counter = self.__parent_task_status_counter()
-
-        # if all sub-tasks has status complete:
-        if statuses_counter[COMPLETE] and not (
-            statuses_counter[RUNNING] or
-            statuses_counter[SCHEDULED]
-        ):
-            return COMPLETE
-
-        # if all sub-tasks has status scheduled
-        elif statuses_counter[SCHEDULED] and not (
-            statuses_counter[RUNNING] or
-            statuses_counter[COMPLETE]
-        ):
-            return SCHEDULED
-
-        # if exactly one sub-task is running
-        elif statuses_counter[RUNNING] == 1:
-            return RUNNING
-
-        # if more then one sub-task is running
-        elif statuses_counter[RUNNING] > 1:
-            return MULTI_RUNS
-
-        else:
-            return IDLE
+        return parent_status_flag(self.__parent_task_status_counter())
 
     def __parent_task_status_counter(self):
         """Returns information about how many sub tasks we have got of a given status.
 
+        Counters of sub tasks are memoized, so every subtree is counted once.
+
         Returns:
             status_counter(container.Counter): returns data structure with status's flags and number of sub tasks.
         """
+        from .memo import current_memo
+
+        return current_memo().get(self, 'status_counter', self.__compute_parent_task_status_counter)
 
+    def __compute_parent_task_status_counter(self):
         status_counter = Counter()
 
-        for subtask in self.subtasks.all():
+        for subtask in self.children:
             if not subtask.has_children:
                 status_counter.update(subtask.__status())
             else:
@@ -204,6 +488,12 @@ class Task(models.Model):
         Returns:
             net_duration(datetime.deltatime()): the sum of time of every task/time scope in the timetable
         """
+        from .memo import task_memo
+
+        with task_memo() as memo:
+            return memo.get(self, 'net_duration', self.__compute_net_duration)
+
+    def __compute_net_duration(self):
         if not self.has_children:
             return self.duration
         return self.__net_duration()
@@ -212,35 +502,58 @@ class Task(models.Model):
         """
         Main logic of calculating net_duration value.
 
-        1. Get the flat list of all node_tasks of this particular parent
-            (children and any grandchildren).
-        2. Sort by 'start_date'
-        3. Merge of tasks that run together,
+        1. Merge time scopes of every child (memoized, children merge scopes
+            of their own node_tasks the same way).
+        2. Sort by start date
+        3. Merge of scopes that overlap,
             we can eliminate repeated time calculations.
         4. Count total net time
 
         Returns:
             total(datetime.timedelta): net duration value
         """
-        merged_subtasks = Task.merge_subtasks_by_scope(
-            Task.sort_flat_children_by_start_date(
-                self.get_flat_subtasks_list()
-            )
-        )
-
         total = timezone.timedelta(0)
-        for subtask in merged_subtasks:
-            total += subtask[1] - subtask[0]
+        for scope in self.__merged_scopes():
+            total += scope[1] - scope[0]
         return total
 
+    def __merged_scopes(self):
+        """Returns sorted [start_date, end_date] scopes of node_tasks of the subtree, merged when they overlap."""
+        from .memo import current_memo
+
+        return current_memo().get(self, 'merged_scopes', self.__compute_merged_scopes)
+
+    def __compute_merged_scopes(self):
+        if not self.has_children:
+            return [[self.start_date, self.end_date]]
+
+        scopes = sorted(
+            (scope for subtask in self.children for scope in subtask.__merged_scopes()),
+            key=lambda scope: scope[0],
+        )
+        merged_scopes = []
+        for start_date, end_date in scopes:
+            if not merged_scopes or start_date > merged_scopes[-1][1]:
+                merged_scopes.append([start_date, end_date])
+            elif end_date > merged_scopes[-1][1]:
+                merged_scopes[-1][1] = end_date
+        return merged_scopes
+
     def get_flat_subtasks_list(self):
-            all = []
-            for sub_task in self.subtasks.all():
-                if not sub_task.subtasks.all():
-                    all.append(sub_task)
-                else:
-                    all.extend(sub_task.get_flat_subtasks_list())
-            return all
+        """Returns node_tasks of the subtree (children and any grandchildren)."""
+        from .memo import task_memo
+
+        with task_memo() as memo:
+            return list(memo.get(self, 'flat_subtasks', self.__compute_flat_subtasks_list))
+
+    def __compute_flat_subtasks_list(self):
+        all = []
+        for sub_task in self.children:
+            if not sub_task.has_children:
+                all.append(sub_task)
+            else:
+                all.extend(sub_task.get_flat_subtasks_list())
+        return all
 
     @staticmethod
     def sort_flat_children_by_start_date(subtasks_flat_list):
@@ -271,11 +584,133 @@ class Task(models.Model):
 @receiver(post_save, sender=Task)
 def update_parent_timetable(sender, instance, **kwargs):
     """Update start_date and end_date
-    values of parent nodes in the tree of tasks."""
+    values of parent nodes in the tree of tasks.
+
+    Sub tasks without dates are ignored: a parent starts with the earliest
+    start_date and ends with the latest end_date of its sub tasks,
+    it stays undated only when none of them has a date.
+    """
     if instance.parent:
-        instance.parent.start_date = instance.parent.subtasks.order_by('start_date').first().start_date
-        instance.parent.end_date = instance.parent.subtasks.order_by('-end_date').first().end_date
+        timetable = instance.parent.subtasks.aggregate(Min('start_date'), Max('end_date'))
+        instance.parent.start_date = timetable['start_date__min']
+        instance.parent.end_date = timetable['end_date__max']
 
         instance.parent.save()
 
 
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_memoized_properties(sender, instance, **kwargs):
+    """Drop memoized properties of the task and its ancestors, see ``tasks.memo``."""
+    from .memo import invalidate_task_memo
+
+    invalidate_task_memo(instance)
+
+
+@receiver(post_save, sender=Owner)
+def replicate_owner(sender, instance, using, raw=False, **kwargs):
+    """Copy owners saved in the default database to all shards."""
+    from .sharding import owner_replicas, replicate_owner
+
+    if not raw and owner_replicas(using):
+        replicate_owner(instance)
+
+
+@receiver(post_delete, sender=Owner)
+def delete_owner_replicas(sender, instance, using, **kwargs):
+    from .sharding import owner_replicas
+
+    for alias in owner_replicas(using):
+        Owner.objects.using(alias).filter(id=instance.id).delete()
+
+
+class TaskIdSequence(models.Model):
+    """The next free task id, shared by all shards."""
+    next_id = models.BigIntegerField()
+
+
+class TaskDeletion(models.Model):
+    """Tombstone of a deleted task, used by clients synchronizing changes."""
+    task_id = models.IntegerField()
+    deleted = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    def __str__(self):
+        return "{} ({})".format(self.task_id,
+                                self.deleted)
+
+
+@receiver(post_delete, sender=Task)
+def log_task_deletion(sender, instance, using, **kwargs):
+    """Record a tombstone of every deleted task, including cascaded sub tasks."""
+    TaskDeletion.objects.using(using).create(task_id=instance.id)
+
+
+class ArchivedTask(models.Model):
+    """Task of a completed tree moved out of the ``Task`` table, see ``TaskQuerySet.archive``."""
+    id = models.IntegerField(
+        primary_key=True,
+    )
+    owner = models.ForeignKey(
+        Owner,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="archived_tasks",
+    )
+    priority = models.CharField(
+        choices=PRIORITY_CHOICES,
+        default='N',
+        null=True,
+        max_length=1,
+    )
+    name = models.CharField(
+        max_length=120,
+    )
+    start_date = models.DateTimeField(
+        null=True,
+    )
+    end_date = models.DateTimeField(
+        null=True,
+    )
+    parent = models.ForeignKey(
+        'self',
+        related_name="subtasks",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    order = models.BigIntegerField(
+        default=0,
+        help_text="Position of the task among sub tasks of the parent.",
+    )
+    created = models.DateTimeField()
+    modified = models.DateTimeField()
+    archived = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    class Meta:
+        ordering = ('parent_id', 'order', 'id')
+
+    def __str__(self):
+        return "{} ({})".format(self.name,
+                                self.id)
+
+    @classmethod
+    def from_task(cls, task):
+        return cls(
+            id=task.id,
+            owner_id=task.owner_id,
+            priority=task.priority,
+            name=task.name,
+            start_date=task.start_date,
+            end_date=task.end_date,
+            parent_id=task.parent_id,
+            order=task.order_key,
+            created=task.created,
+            modified=task.modified,
+        )
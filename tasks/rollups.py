@@ -0,0 +1,69 @@
+"""Rollup of parent start_date and end_date values computed outside of the ORM.
+
+Functions of this module work on plain tuples, so they can be sent
+to worker processes without Django models.
+"""
+from collections import defaultdict
+
+
+ROLLUP_FIELDS = (
+    'id',
+    'parent_id',
+    'start_date',
+    'end_date',
+)
+
+
+def chunked(items, size):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+def compute_rollups(rows):
+    """Returns parent tasks whose start_date or end_date differ from the rollup of their sub tasks.
+
+    Rollup is the same as ``update_parent_timetable`` maintains: a parent starts with the
+    earliest sub task and ends with the latest one, sub tasks without dates are ignored.
+    Values of node_tasks are never changed.
+
+    Args:
+        rows(list): (id, parent_id, start_date, end_date) tuples of complete trees.
+
+    Returns:
+        changes(list): (id, old_start_date, old_end_date, new_start_date, new_end_date) tuples
+    """
+    by_id = {}
+    children = defaultdict(list)
+    for task_id, parent_id, start_date, end_date in rows:
+        by_id[task_id] = (start_date, end_date)
+        children[parent_id].append(task_id)
+
+    roots = [task_id for task_id, parent_id, _, _ in rows if parent_id not in by_id]
+
+    computed = {}
+    changes = []
+    stack = [(task_id, False) for task_id in roots]
+    while stack:
+        task_id, visited = stack.pop()
+        subtasks = children.get(task_id)
+
+        if not subtasks:
+            computed[task_id] = by_id[task_id]
+
+        elif not visited:
+            stack.append((task_id, True))
+            stack.extend((subtask_id, False) for subtask_id in subtasks)
+
+        else:
+            starts = [computed[subtask_id][0] for subtask_id in subtasks
+                      if computed[subtask_id][0] is not None]
+            ends = [computed[subtask_id][1] for subtask_id in subtasks
+                    if computed[subtask_id][1] is not None]
+            rollup = (min(starts) if starts else None,
+                      max(ends) if ends else None)
+
+            computed[task_id] = rollup
+            if rollup != by_id[task_id]:
+                changes.append((task_id,) + by_id[task_id] + rollup)
+
+    return changes
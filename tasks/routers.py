@@ -0,0 +1,44 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Task, TaskIdSequence
+from .sharding import shard_for_task, sharding_enabled
+
+
+class TaskShardRouter:
+    """Routes trees of tasks to their shards, see ``tasks.sharding``.
+
+    Does nothing when the ``TASKS_SHARDS`` setting is empty.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not sharding_enabled() or model._meta.app_label != 'tasks':
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not sharding_enabled() or model._meta.app_label != 'tasks':
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if isinstance(instance, Task) and instance.pk is not None:
+            return shard_for_task(instance)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # owners are copied to every shard
+        if sharding_enabled() and obj1._meta.app_label == obj2._meta.app_label == 'tasks':
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not sharding_enabled():
+            return None
+        if app_label != 'tasks':
+            return db == DEFAULT_DB_ALIAS
+        if model_name == TaskIdSequence._meta.model_name:
+            return db == DEFAULT_DB_ALIAS
+        return None
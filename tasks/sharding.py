@@ -0,0 +1,226 @@
+"""Trees of tasks spread over several databases (shards).
+
+Every root task, together with all its descendants, lives in one shard
+chosen by a hash of the root id. Trees are moved to another shard when
+their root task is put under a parent in that shard, or a sub task becomes
+a root. Ids of tasks are unique across shards: they are
+handed out in blocks reserved in the default database. ``Owner`` rows are
+written to the default database and copied to every shard.
+
+Shards are aliases of ``DATABASES`` listed in the ``TASKS_SHARDS`` setting,
+sharding is off when the list is empty.
+"""
+import heapq
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import cmp_to_key
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F, Max
+from django.db.models.constants import LOOKUP_SEP
+
+from .models import IN_BATCH_SIZE, ArchivedTask, Owner, Task, TaskDeletion, TaskIdSequence
+
+
+def sharding_enabled():
+    return bool(getattr(settings, 'TASKS_SHARDS', None))
+
+
+def task_databases():
+    """Returns aliases of databases holding tasks."""
+    return list(getattr(settings, 'TASKS_SHARDS', None) or [DEFAULT_DB_ALIAS])
+
+
+def shard_for_root(root_id):
+    """Returns alias of the shard of a tree with the given root id.
+
+    Ids are shared by roots and sub tasks, so ids of roots of equally sized trees
+    are evenly spaced; they are hashed instead of taken modulo number of shards.
+    """
+    shards = task_databases()
+    return shards[zlib.crc32(str(root_id).encode()) % len(shards)]
+
+
+def shard_for_task(task):
+    """Returns alias of the shard of the task's tree."""
+    if task.parent_id is None:
+        return shard_for_root(task.pk)
+    if Task.parent.is_cached(task) and task.parent._state.db:
+        return task.parent._state.db
+    # most saved tasks keep their parent, look in the task's own shard first
+    if task._state.db and Task.objects.using(task._state.db).filter(id=task.parent_id).exists():
+        return task._state.db
+    return find_task_database(task.parent_id)
+
+
+def move_tree(task, target):
+    """Copies the saved task with all its descendants from its shard to the ``target`` shard
+    and deletes them from the old one.
+
+    Rows keep their ids and ``created`` values, tombstones of the deleted rows are dropped,
+    so clients synchronizing changes see the moved tasks as modified only.
+    Call it in transactions of both databases.
+    """
+    source = task._state.db
+    levels = Task.objects.using(source).subtree_levels([task.pk])
+    for level in levels:
+        created = [row.created for row in level]
+        Task.objects.using(target).bulk_create(level, batch_size=IN_BATCH_SIZE)
+        for row, value in zip(level, created):
+            row.created = value
+        Task.objects.using(target).bulk_update(level, ['created'], batch_size=IN_BATCH_SIZE)
+
+    Task.objects.using(source).filter(id=task.pk).delete()
+    task_ids = [row.id for level in levels for row in level]
+    for index in range(0, len(task_ids), IN_BATCH_SIZE):
+        TaskDeletion.objects.using(source).filter(task_id__in=task_ids[index:index + IN_BATCH_SIZE]).delete()
+
+
+def find_task_database(task_id):
+    """Returns alias of the shard holding the task.
+
+    Raises:
+        Task.DoesNotExist: if there is no such task in any shard
+    """
+    found = fan_out(lambda alias: Task.objects.using(alias).filter(id=task_id).exists())
+    for alias, exists in zip(task_databases(), found):
+        if exists:
+            return alias
+    raise Task.DoesNotExist("Task {} does not exist in any shard.".format(task_id))
+
+
+def fan_out(function, aliases=None):
+    """Calls ``function(alias)`` for every shard in parallel threads.
+
+    Returns:
+        results(list): results in the order of aliases
+    """
+    aliases = aliases or task_databases()
+    if len(aliases) == 1:
+        return [function(aliases[0])]
+
+    def call(alias):
+        try:
+            return function(alias)
+        finally:
+            # connections are per thread, don't leave them behind
+            connections[alias].close()
+
+    with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+        return list(executor.map(call, aliases))
+
+
+def fan_out_list(queryset):
+    """Returns objects of the queryset read from every shard, merged by the ordering of the queryset.
+
+    The queryset is returned unchanged when sharding is off.
+    """
+    if not sharding_enabled():
+        return queryset
+    results = fan_out(lambda alias: list(queryset.using(alias)))
+    return list(heapq.merge(*results, key=ordering_key(queryset)))
+
+
+def ordering_key(queryset):
+    """Returns sort key function of objects of the queryset, following its ``order_by()``
+    or the default ordering of the model, then the primary key.
+
+    NULLs come first in ascending order, like in SQLite. Expressions in the ordering are skipped.
+    """
+    query = queryset.query
+    ordering = query.order_by or (query.default_ordering and queryset.model._meta.ordering) or ()
+    fields = [
+        (name.lstrip('-'), name.startswith('-'))
+        for name in ordering
+        if isinstance(name, str) and name != '?'
+    ]
+    fields.append(('pk', False))
+
+    def compare(first, second):
+        for name, descending in fields:
+            first_value, second_value = field_value(first, name), field_value(second, name)
+            if first_value == second_value:
+                continue
+            if first_value is None or (second_value is not None and first_value < second_value):
+                result = -1
+            else:
+                result = 1
+            return -result if descending else result
+        return 0
+
+    return cmp_to_key(compare)
+
+
+def field_value(obj, name):
+    """Returns value of the ``name`` field of the object, following ``__`` to related objects."""
+    *path, last = name.split(LOOKUP_SEP)
+    for part in path:
+        obj = getattr(obj, part)
+        if obj is None:
+            return None
+    if last == 'pk':
+        return obj.pk
+    # foreign keys are compared by their column, without reading related objects
+    return getattr(obj, obj._meta.get_field(last).attname)
+
+
+def fan_out_get(queryset, **kwargs):
+    """Returns the only object matching ``kwargs`` in any shard.
+
+    Raises:
+        DoesNotExist: if there is no such object
+    """
+    if not sharding_enabled():
+        return queryset.get(**kwargs)
+    for objects in fan_out(lambda alias: list(queryset.using(alias).filter(**kwargs)[:1])):
+        if objects:
+            return objects[0]
+    raise queryset.model.DoesNotExist()
+
+
+def owner_replicas(using):
+    """Returns aliases of shards which copy an owner saved in the ``using`` database."""
+    if not sharding_enabled() or using != DEFAULT_DB_ALIAS:
+        return []
+    return [alias for alias in task_databases() if alias != DEFAULT_DB_ALIAS]
+
+
+def replicate_owner(owner):
+    for alias in owner_replicas(DEFAULT_DB_ALIAS):
+        values = {'name': owner.name, 'surname': owner.surname}
+        if not Owner.objects.using(alias).filter(id=owner.id).update(**values):
+            Owner.objects.using(alias).create(id=owner.id, **values)
+
+
+_id_block = {'next': 0, 'end': 0}
+_id_block_lock = threading.Lock()
+
+
+def allocate_task_id():
+    """Returns a new task id, unique across all shards."""
+    with _id_block_lock:
+        if _id_block['next'] >= _id_block['end']:
+            size = getattr(settings, 'TASKS_ID_BLOCK_SIZE', 100)
+            _id_block['next'] = reserve_task_ids(size)
+            _id_block['end'] = _id_block['next'] + size
+        task_id = _id_block['next']
+        _id_block['next'] += 1
+        return task_id
+
+
+def reserve_task_ids(size):
+    """Reserves ``size`` consecutive ids in the default database and returns the first one."""
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        # UPDATE first, so concurrent processes wait for the write lock instead of reading the same value
+        sequences = TaskIdSequence.objects.using(DEFAULT_DB_ALIAS)
+        if sequences.filter(id=1).update(next_id=F('next_id') + size):
+            return sequences.get(id=1).next_id - size
+
+        first = max(fan_out(lambda alias: max(
+            model.objects.using(alias).aggregate(Max('id'))['id__max'] or 0
+            for model in (Task, ArchivedTask)
+        ))) + 1
+        sequences.create(id=1, next_id=first + size)
+        return first
@@ -0,0 +1,700 @@
+"""Compact, per-process read model of the task forest.
+
+The snapshot keeps fields of tasks in typed arrays of ``TaskColumns`` and
+indexes of ids and children in a ``TaskForest``, so pages and API calls that
+only read the tree don't have to build full ``Task`` model instances.
+``TaskNode`` objects are created only for the tasks that are read.
+
+It is loaded once and refreshed incrementally: every refresh only fetches
+rows whose ``Task.modified`` is not older than the newest value seen so far,
+minus ``TASKS_SYNC_WINDOW`` seconds for transactions committed late.
+
+Enable it with ``TASKS_SNAPSHOT = True`` in the settings module.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from collections.abc import Mapping
+from itertools import chain
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import (
+    Owner,
+    Task,
+    TaskDeletion,
+    TASK_STATUS_MAPPER,
+    PRIORITY_CHOICES,
+    RUNNING,
+    SCHEDULED,
+    node_status_flag,
+    parent_status_flag,
+)
+from .sharding import fan_out
+
+
+SNAPSHOT_FIELDS = (
+    'id',
+    'parent_id',
+    'order_key',
+    'start_date',
+    'end_date',
+    'owner_id',
+    'priority',
+    'name',
+    'modified',
+)
+
+PRIORITY_MAPPER = dict(PRIORITY_CHOICES)
+
+FAR_FUTURE = timezone.datetime.max.replace(tzinfo=timezone.utc)
+
+# rows of replaced nodes kept in columns before live rows are copied to new ones, see ``TaskSnapshot._refresh``
+COMPACT_MIN_ROWS = 1024
+
+EPOCH = timezone.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# stands for None in integer columns
+NULL = -2 ** 63
+
+
+def encode_int(value):
+    return NULL if value is None else value
+
+
+def decode_int(value):
+    return None if value == NULL else value
+
+
+def encode_datetime(value):
+    """Returns number of microseconds since the epoch, NULL for None."""
+    return NULL if value is None else (value - EPOCH) // timezone.timedelta(microseconds=1)
+
+
+def decode_datetime(value):
+    return None if value == NULL else EPOCH + timezone.timedelta(microseconds=value)
+
+
+def sync_window():
+    """Returns how long rows of committing transactions may stay invisible to readers."""
+    return timezone.timedelta(seconds=getattr(settings, 'TASKS_SYNC_WINDOW', 60))
+
+
+class TaskColumns:
+    """Fields of snapshot nodes, one row of typed arrays per loaded task row.
+
+    A row takes 8 bytes per field instead of separate ``int`` and ``datetime`` objects:
+    dates are stored as microseconds since the epoch, priorities as indexes of shared
+    values and names in one UTF-8 buffer. Rows are only appended, so nodes replaced
+    by a refresh keep their values for readers of the previous forest.
+    """
+
+    def __init__(self):
+        self.id = array('q')
+        self.parent_id = array('q')
+        self.order = array('q')
+        self.start_date = array('q')
+        self.end_date = array('q')
+        self.owner_id = array('q')
+        self.priority = array('H')
+        self.modified = array('q')
+        self.name_end = array('q')
+        self.names = bytearray()
+        self.priorities = []
+        self._priority_codes = {}
+
+    def __len__(self):
+        return len(self.id)
+
+    def append(self, task_id, parent_id, order, start_date, end_date, owner_id, priority, name, modified):
+        """Adds a row with values in the order of ``SNAPSHOT_FIELDS`` and returns its number."""
+        code = self._priority_codes.get(priority)
+        if code is None:
+            code = self._priority_codes[priority] = len(self.priorities)
+            self.priorities.append(priority)
+
+        self.id.append(task_id)
+        self.parent_id.append(encode_int(parent_id))
+        self.order.append(encode_int(order))
+        self.start_date.append(encode_datetime(start_date))
+        self.end_date.append(encode_datetime(end_date))
+        self.owner_id.append(encode_int(owner_id))
+        self.priority.append(code)
+        self.modified.append(encode_datetime(modified))
+        self.names.extend(name.encode())
+        self.name_end.append(len(self.names))
+        return len(self.id) - 1
+
+    def values(self, row):
+        """Returns values of the row in the order of ``SNAPSHOT_FIELDS``."""
+        return (
+            self.id[row],
+            decode_int(self.parent_id[row]),
+            decode_int(self.order[row]),
+            decode_datetime(self.start_date[row]),
+            decode_datetime(self.end_date[row]),
+            decode_int(self.owner_id[row]),
+            self.priorities[self.priority[row]],
+            self.name(row),
+            decode_datetime(self.modified[row]),
+        )
+
+    def name(self, row):
+        start = self.name_end[row - 1] if row else 0
+        return self.names[start:self.name_end[row]].decode()
+
+
+class TaskNode:
+    """Read-only twin of a ``Task`` row.
+
+    Exposes the same attributes and calculated properties that templates
+    and serializers use on ``Task`` objects. Nodes are created on access,
+    fields are read from the ``row`` of columns of the ``forest``.
+    """
+
+    __slots__ = (
+        'forest',
+        'row',
+    )
+
+    def __init__(self, forest, row):
+        self.forest = forest
+        self.row = row
+
+    def __eq__(self, other):
+        return (isinstance(other, TaskNode) and self.row == other.row
+                and self.forest.columns is other.forest.columns)
+
+    def __hash__(self):
+        return hash(self.row)
+
+    def __str__(self):
+        return "{} ({})".format(self.name,
+                                self.id)
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def snapshot(self):
+        return self.forest.snapshot
+
+    @property
+    def id(self):
+        return self.forest.columns.id[self.row]
+
+    @property
+    def name(self):
+        return self.forest.columns.name(self.row)
+
+    @property
+    def parent_id(self):
+        return decode_int(self.forest.columns.parent_id[self.row])
+
+    @property
+    def order(self):
+        return decode_int(self.forest.columns.order[self.row])
+
+    @property
+    def start_date(self):
+        return decode_datetime(self.forest.columns.start_date[self.row])
+
+    @property
+    def end_date(self):
+        return decode_datetime(self.forest.columns.end_date[self.row])
+
+    @property
+    def owner_id(self):
+        return decode_int(self.forest.columns.owner_id[self.row])
+
+    @property
+    def priority(self):
+        columns = self.forest.columns
+        return columns.priorities[columns.priority[self.row]]
+
+    @property
+    def modified(self):
+        return decode_datetime(self.forest.columns.modified[self.row])
+
+    @property
+    def parent(self):
+        return self.forest.nodes.get(self.parent_id)
+
+    @property
+    def owner(self):
+        return self.snapshot.owners.get(self.owner_id)
+
+    @property
+    def children(self):
+        return self.forest.children.get(self.id, ())
+
+    @property
+    def has_children(self):
+        return len(self.children)
+
+    def get_priority_display(self):
+        return PRIORITY_MAPPER.get(self.priority, self.priority)
+
+    @property
+    def status(self):
+        return TASK_STATUS_MAPPER.get(self.snapshot.status_flags().get(self.id))
+
+    @property
+    def duration(self):
+        return self.end_date - self.start_date
+
+    @property
+    def net_duration(self):
+        return self.snapshot.net_duration(self)
+
+
+class TaskForest:
+    """Indexes of one refresh of the snapshot over rows of ``TaskColumns``.
+
+    ``ids`` and ``rows`` map sorted task ids to their rows. ``child_parents`` and
+    ``child_rows`` hold rows sorted by parent id (NULL for roots), order and id,
+    so sub tasks of a parent are a slice found by bisection. A forest isn't
+    changed once built.
+
+    Attributes:
+        nodes(NodeIndex): TaskNode objects by task id.
+        children(ChildrenIndex): tuples of child TaskNode objects by parent id, the roots are under ``None`` key.
+    """
+
+    def __init__(self, snapshot, columns, ids=None, rows=None, child_parents=None, child_rows=None):
+        self.snapshot = snapshot
+        self.columns = columns
+        self.ids = array('q') if ids is None else ids
+        self.rows = array('q') if rows is None else rows
+        self.child_parents = array('q') if child_parents is None else child_parents
+        self.child_rows = array('q') if child_rows is None else child_rows
+        self.nodes = NodeIndex(self)
+        self.children = ChildrenIndex(self)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self, task_id):
+        """Returns row of the task, None when it isn't in the forest."""
+        if task_id is None:
+            return None
+        index = bisect_left(self.ids, task_id)
+        if index < len(self.ids) and self.ids[index] == task_id:
+            return self.rows[index]
+        return None
+
+    def child_range(self, parent_id):
+        """Returns (start, stop) of the slice of ``child_rows`` with sub tasks of the parent."""
+        key = encode_int(parent_id)
+        return bisect_left(self.child_parents, key), bisect_right(self.child_parents, key)
+
+
+class NodeIndex(Mapping):
+    """TaskNode objects of a forest by task id, in the order of ids."""
+
+    def __init__(self, forest):
+        self.forest = forest
+
+    def __getitem__(self, task_id):
+        row = self.forest.row_of(task_id)
+        if row is None:
+            raise KeyError(task_id)
+        return TaskNode(self.forest, row)
+
+    def __contains__(self, task_id):
+        return self.forest.row_of(task_id) is not None
+
+    def __iter__(self):
+        return iter(self.forest.ids)
+
+    def __len__(self):
+        return len(self.forest)
+
+    def values(self):
+        forest = self.forest
+        return [TaskNode(forest, row) for row in forest.rows]
+
+
+class ChildrenIndex(Mapping):
+    """Tuples of child TaskNode objects of a forest by parent id, ordered like sub tasks."""
+
+    def __init__(self, forest):
+        self.forest = forest
+
+    def __getitem__(self, parent_id):
+        start, stop = self.forest.child_range(parent_id)
+        if start == stop:
+            raise KeyError(parent_id)
+        forest = self.forest
+        return tuple(TaskNode(forest, row) for row in forest.child_rows[start:stop])
+
+    def __contains__(self, parent_id):
+        start, stop = self.forest.child_range(parent_id)
+        return start != stop
+
+    def __iter__(self):
+        previous = None
+        for key in self.forest.child_parents:
+            if key != previous:
+                previous = key
+                yield decode_int(key)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def child_position(child_parents, child_rows, columns, row):
+    """Returns index of the row among rows sorted by parent id, order and id."""
+    parent_key = columns.parent_id[row]
+    key = (columns.order[row], columns.id[row])
+    low = bisect_left(child_parents, parent_key)
+    high = bisect_right(child_parents, parent_key)
+    while low < high:
+        middle = (low + high) // 2
+        other = child_rows[middle]
+        if (columns.order[other], columns.id[other]) < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class TaskSnapshot:
+    """In-memory copy of the whole task forest.
+
+    Refreshes never change indexes which readers may hold: they build new ones
+    and swap them in with a single assignment (copy-on-write), so readers don't
+    need the lock.
+
+    Attributes:
+        nodes(NodeIndex): TaskNode objects by task id.
+        children(ChildrenIndex): tuples of child TaskNode objects by parent id, the roots are under ``None`` key.
+        owners(dict): Owner objects by id.
+        high_water(datetime.datetime): the newest ``Task.modified`` value already loaded.
+        deletions_high_water(datetime.datetime): the newest ``TaskDeletion.deleted`` value already applied.
+        version(int): number of refreshes that changed the snapshot.
+        refreshed_at(float): ``time.monotonic()`` of the last refresh, None before the first one.
+    """
+
+    def __init__(self):
+        self._columns = TaskColumns()
+        self._forest = TaskForest(self, self._columns)
+        self.owners = {}
+        self.high_water = None
+        self.deletions_high_water = None
+        self.version = 0
+        self.refreshed_at = None
+        self._owners_state = None
+        self._lock = threading.Lock()
+        self._statuses = None
+        self._net_durations = (None, {})
+
+    @property
+    def nodes(self):
+        return self._forest.nodes
+
+    @property
+    def children(self):
+        return self._forest.children
+
+    def indexes(self):
+        """Returns (nodes, children) indexes of the same refresh."""
+        forest = self._forest
+        return forest.nodes, forest.children
+
+    def roots(self):
+        return self.children.get(None, ())
+
+    def all(self):
+        """Returns all nodes in the default ordering of tasks, by order_key and id."""
+        forest = self._forest
+        columns = forest.columns
+        rows = sorted(forest.rows, key=lambda row: (columns.order[row], columns.id[row]))
+        return [TaskNode(forest, row) for row in rows]
+
+    def get(self, task_id):
+        return self.nodes.get(task_id)
+
+    def refresh_if_due(self, interval):
+        """Refreshes the snapshot unless it was refreshed less than ``interval`` seconds ago.
+
+        Only one thread refreshes at a time, other threads keep reading the current
+        indexes instead of waiting for it. Only the first load is waited for.
+        """
+        loaded = self.refreshed_at is not None
+        if loaded and time.monotonic() - self.refreshed_at < interval:
+            return
+        if not self._lock.acquire(blocking=not loaded):
+            return
+        try:
+            if self.refreshed_at is None or time.monotonic() - self.refreshed_at >= interval:
+                self._refresh()
+        finally:
+            self._lock.release()
+
+    def refresh(self):
+        """Loads tasks created or modified since the last refresh.
+
+        Returns:
+            changed(int): number of new, modified or deleted tasks applied to the snapshot
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        """Refreshes the snapshot, the caller holds the lock."""
+        # marks move only once the rows are applied, a failed refresh is repeated in full
+        high_water = self.high_water
+        deletions_high_water = self.deletions_high_water
+        if deletions_high_water is None:
+            # tombstones older than the first load are already reflected in it
+            deletions_high_water = timezone.now()
+
+        queryset = Task.objects.all()
+        if high_water is not None:
+            # rows are read again until they are older than the window, unchanged ones are skipped
+            queryset = queryset.filter(modified__gte=high_water - sync_window())
+        queryset = queryset.order_by().values_list(*SNAPSHOT_FIELDS)
+        rows = list(chain.from_iterable(fan_out(lambda alias: list(queryset.using(alias)))))
+
+        forest = self._forest
+        rows = [row for row in rows if self._is_newer(forest, row)]
+        for row in rows:
+            if high_water is None or row[-1] > high_water:
+                high_water = row[-1]
+        deleted_ids, deletions_high_water = self._deleted_ids(deletions_high_water)
+        # tasks deleted after their rows were read
+        rows = [row for row in rows if row[0] not in deleted_ids]
+        deleted_ids = {task_id for task_id in deleted_ids if task_id in forest.nodes}
+
+        # saved owners get a newer ``modified``, deleted ones lower the count
+        owners_state = Owner.objects.aggregate(count=Count('id'), modified=Max('modified'))
+        owners = self.owners
+        if owners_state != self._owners_state:
+            owners = Owner.objects.in_bulk()
+
+        changed = len(rows) + len(deleted_ids)
+        if changed:
+            if len(self._columns) + len(rows) > 2 * len(forest) + COMPACT_MIN_ROWS:
+                # most rows belong to replaced or deleted tasks, live ones are copied to new columns
+                self._columns = TaskColumns()
+            self._forest = self._apply(rows, deleted_ids, forest)
+            self.version += 1
+        self.owners = owners
+        self._owners_state = owners_state
+        self.refreshed_at = time.monotonic()
+        self.high_water = high_water
+        self.deletions_high_water = deletions_high_water
+        return changed
+
+    @staticmethod
+    def _is_newer(forest, row):
+        """Returns True for rows of tasks not in the forest or modified since it was loaded."""
+        task_row = forest.row_of(row[0])
+        return task_row is None or encode_datetime(row[-1]) > forest.columns.modified[task_row]
+
+    def _deleted_ids(self, high_water):
+        """Returns ids of tasks deleted since the ``high_water`` of the deletion log,
+        and the new high water.
+        """
+        tombstones = TaskDeletion.objects.filter(
+            deleted__gte=high_water - sync_window()
+        ).order_by().values_list('task_id', 'deleted')
+
+        deleted_ids = set()
+        for task_id, deleted_at in chain.from_iterable(fan_out(lambda alias: list(tombstones.using(alias)))):
+            if deleted_at > high_water:
+                high_water = deleted_at
+            deleted_ids.add(task_id)
+        return deleted_ids, high_water
+
+    def _apply(self, rows, deleted_ids, forest):
+        """Returns a new forest with the rows and deletions applied.
+
+        Rows are appended to the columns. A few changes are applied to copies
+        of indexes of the forest, many of them or new columns build the indexes again.
+        """
+        columns = self._columns
+        changed_ids = {row[0] for row in rows} | deleted_ids
+        if columns is forest.columns and len(changed_ids) <= max(64, len(forest) // 8):
+            return self._update(forest, rows, deleted_ids)
+
+        live_rows = [row for row in forest.rows if forest.columns.id[row] not in changed_ids]
+        if columns is not forest.columns:
+            live_rows = [columns.append(*forest.columns.values(row)) for row in live_rows]
+        live_rows.extend(columns.append(*row) for row in rows)
+
+        ids, parents, orders = columns.id, columns.parent_id, columns.order
+        by_id = sorted(live_rows, key=ids.__getitem__)
+        by_parent = sorted(live_rows, key=lambda row: (parents[row], orders[row], ids[row]))
+        return TaskForest(
+            self,
+            columns,
+            array('q', (ids[row] for row in by_id)),
+            array('q', by_id),
+            array('q', (parents[row] for row in by_parent)),
+            array('q', by_parent),
+        )
+
+    def _update(self, forest, rows, deleted_ids):
+        """Returns a new forest with a few rows and deletions applied to copies of the indexes."""
+        columns = forest.columns
+        ids = array('q', forest.ids)
+        task_rows = array('q', forest.rows)
+        child_parents = array('q', forest.child_parents)
+        child_rows = array('q', forest.child_rows)
+
+        def remove_child(row):
+            index = child_position(child_parents, child_rows, columns, row)
+            del child_parents[index]
+            del child_rows[index]
+
+        for values in rows:
+            row = columns.append(*values)
+            index = bisect_left(ids, values[0])
+            if index < len(ids) and ids[index] == values[0]:
+                remove_child(task_rows[index])
+                task_rows[index] = row
+            else:
+                ids.insert(index, values[0])
+                task_rows.insert(index, row)
+            index = child_position(child_parents, child_rows, columns, row)
+            child_parents.insert(index, columns.parent_id[row])
+            child_rows.insert(index, row)
+
+        for task_id in deleted_ids:
+            index = bisect_left(ids, task_id)
+            remove_child(task_rows[index])
+            del ids[index]
+            del task_rows[index]
+        return TaskForest(self, columns, ids, task_rows, child_parents, child_rows)
+
+    def status_flags(self, current=None):
+        """Returns status flags of every task in the forest.
+
+        Flags are calculated in one bottom-up pass and reused until
+        the nearest start_date or end_date of any node_task is reached,
+        or until the forest changes.
+
+        Returns:
+            statuses(dict): status flag by task id
+        """
+        current = current or timezone.now()
+        forest = self._forest
+        cached = self._statuses
+        if cached is not None and cached[0] is forest and cached[1] <= current < cached[2]:
+            return cached[3]
+
+        children = forest.children
+        statuses = {}
+        valid_until = FAR_FUTURE
+        for root in children.get(None, ()):
+            _, boundary = self._collect_statuses(root, current, statuses, children)
+            valid_until = min(valid_until, boundary)
+
+        self._statuses = (forest, current, valid_until, statuses)
+        return statuses
+
+    def _collect_statuses(self, root, current, statuses, children_index):
+        """Returns counter of node_task flags and the nearest status change moment of the subtree."""
+        results = {}
+        stack = [(root, False)]
+        while stack:
+            node, visited = stack.pop()
+            children = children_index.get(node.id)
+
+            if not children:
+                counter = Counter()
+                boundary = FAR_FUTURE
+                if node.start_date is not None and node.end_date is not None:
+                    flag = node_status_flag(node.start_date, node.end_date, current)
+                    statuses[node.id] = flag
+                    counter[flag] += 1
+                    if flag == SCHEDULED:
+                        boundary = node.start_date
+                    elif flag == RUNNING:
+                        boundary = node.end_date
+                results[node.id] = (counter, boundary)
+
+            elif not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children)
+
+            else:
+                counter = Counter()
+                boundary = FAR_FUTURE
+                for child in children:
+                    child_counter, child_boundary = results.pop(child.id)
+                    counter.update(child_counter)
+                    boundary = min(boundary, child_boundary)
+                statuses[node.id] = parent_status_flag(counter)
+                results[node.id] = (counter, boundary)
+
+        return results[root.id]
+
+    def flat_subtasks(self, node, children_index=None):
+        """Returns node_tasks of the subtree, the same as ``Task.get_flat_subtasks_list``."""
+        children_index = children_index or self.children
+        leaves = []
+        stack = list(reversed(children_index.get(node.id, ())))
+        while stack:
+            child = stack.pop()
+            grandchildren = children_index.get(child.id)
+            if grandchildren:
+                stack.extend(reversed(grandchildren))
+            else:
+                leaves.append(child)
+        return leaves
+
+    def net_duration(self, node):
+        """Returns net_duration of the node, see ``Task.net_duration``."""
+        if not node.has_children:
+            return node.duration
+
+        forest = self._forest
+        cached_forest, totals = self._net_durations
+        if cached_forest is not forest:
+            totals = {}
+            self._net_durations = (forest, totals)
+
+        total = totals.get(node.id)
+        if total is None:
+            leaves = [leaf for leaf in self.flat_subtasks(node, forest.children) if leaf.start_date is not None]
+            merged_subtasks = Task.merge_subtasks_by_scope(
+                Task.sort_flat_children_by_start_date(leaves)
+            )
+            total = timezone.timedelta(0)
+            for subtask in merged_subtasks:
+                total += subtask[1] - subtask[0]
+            totals[node.id] = total
+        return total
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def snapshot_enabled():
+    return getattr(settings, 'TASKS_SNAPSHOT', False)
+
+
+def get_snapshot():
+    """Returns the process-wide snapshot, refreshed at most once per ``TASKS_SNAPSHOT_REFRESH`` seconds."""
+    global _snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = TaskSnapshot()
+    _snapshot.refresh_if_due(getattr(settings, 'TASKS_SNAPSHOT_REFRESH', 1))
+    return _snapshot
+
+
+def reset_snapshot():
+    """Drops the process-wide snapshot, next ``get_snapshot`` call loads it again."""
+    global _snapshot
+    _snapshot = None
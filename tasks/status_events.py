@@ -0,0 +1,191 @@
+"""Push notifications of task status transitions.
+
+Statuses change only when the current time passes start_date or end_date
+of a node_task. ``StatusScheduler`` keeps those moments in a single timer
+heap shared by all subscribers, and on every due moment recomputes only
+the node_task and its ancestors, publishing the tasks whose status changed.
+"""
+import heapq
+import logging
+import queue
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import (
+    RUNNING,
+    SCHEDULED,
+    TASK_STATUS_MAPPER,
+    node_status_flag,
+    parent_status_flag,
+)
+from .snapshot import get_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class StatusScheduler:
+    """Timer heap of the next status change of every node_task.
+
+    Attributes:
+        flags(dict): current status flag by task id.
+    """
+
+    def __init__(self):
+        self.flags = {}
+        self._heap = []
+        self._counters = {}
+        self._ancestors = {}
+        self._snapshot_version = None
+        self._subscribers = set()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def subscribe(self):
+        """Returns a queue receiving lists of status changes."""
+        events = queue.Queue()
+        with self._condition:
+            self._subscribers.add(events)
+        self._ensure_running()
+        return events
+
+    def unsubscribe(self, events):
+        with self._condition:
+            self._subscribers.discard(events)
+
+    def publish(self, changes):
+        with self._condition:
+            subscribers = list(self._subscribers)
+        for events in subscribers:
+            events.put(changes)
+
+    def next_moment(self):
+        """Returns the nearest moment of a status change, or None."""
+        return self._heap[0][0] if self._heap else None
+
+    def advance(self, current, snapshot=None):
+        """Applies all status changes due at the ``current`` moment.
+
+        Returns:
+            changes(list): dicts with id and human-friendly status of every changed task
+        """
+        snapshot = snapshot or get_snapshot()
+        if snapshot.version != self._snapshot_version:
+            changed = self._rebuild(snapshot, current)
+        else:
+            changed = self._pop_due(snapshot, current)
+
+        return [
+            {'id': task_id, 'status': TASK_STATUS_MAPPER[self.flags[task_id]]}
+            for task_id in sorted(changed)
+        ]
+
+    def _rebuild(self, snapshot, current):
+        """Recomputes statuses and the timer heap after the task forest has changed."""
+        # read before the indexes, a refresh in between only causes another rebuild
+        version = snapshot.version
+        nodes, children = snapshot.indexes()
+        first_build = self._snapshot_version is None
+        previous = self.flags
+        self.flags = {}
+        self._heap = []
+        self._counters = defaultdict(Counter)
+        self._ancestors = {}
+
+        for node in nodes.values():
+            if node.id in children or node.start_date is None or node.end_date is None:
+                continue
+            ancestors = []
+            parent = nodes.get(node.parent_id)
+            while parent is not None:
+                ancestors.append(parent.id)
+                parent = nodes.get(parent.parent_id)
+            self._ancestors[node.id] = ancestors
+
+            flag = self._schedule(node, current)
+            for ancestor_id in ancestors:
+                self._counters[ancestor_id][flag] += 1
+
+        for task_id, counter in self._counters.items():
+            self.flags[task_id] = parent_status_flag(counter)
+
+        self._snapshot_version = version
+        if first_build:
+            return []
+        return [task_id for task_id, flag in self.flags.items() if previous.get(task_id) != flag]
+
+    def _pop_due(self, snapshot, current):
+        changed = set()
+        while self._heap and self._heap[0][0] <= current:
+            _, task_id = heapq.heappop(self._heap)
+            old_flag = self.flags[task_id]
+            new_flag = self._schedule(snapshot.get(task_id), current)
+            if new_flag == old_flag:
+                continue
+
+            changed.add(task_id)
+            for ancestor_id in self._ancestors[task_id]:
+                counter = self._counters[ancestor_id]
+                counter[old_flag] -= 1
+                counter[new_flag] += 1
+                flag = parent_status_flag(counter)
+                if flag != self.flags[ancestor_id]:
+                    self.flags[ancestor_id] = flag
+                    changed.add(ancestor_id)
+        return changed
+
+    def _schedule(self, node, current):
+        """Sets status of the node_task and pushes the moment of its next change to the heap."""
+        flag = node_status_flag(node.start_date, node.end_date, current)
+        self.flags[node.id] = flag
+        if flag == SCHEDULED:
+            heapq.heappush(self._heap, (node.start_date, node.id))
+        elif flag == RUNNING:
+            heapq.heappush(self._heap, (node.end_date + timezone.timedelta(microseconds=1), node.id))
+        return flag
+
+    def _ensure_running(self):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="task-status-scheduler", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """Publishes status changes while there is at least one subscriber."""
+        refresh_interval = getattr(settings, 'TASKS_STATUS_STREAM_REFRESH', 5)
+        try:
+            while True:
+                current = timezone.now()
+                try:
+                    changes = self.advance(current)
+                except Exception:
+                    # keep the streams open, the next refresh starts from a rebuild
+                    logger.exception("Status scheduler failed to advance.")
+                    self._snapshot_version = None
+                    changes = []
+                if changes:
+                    self.publish(changes)
+
+                # wake up on the next status change, or to pick up edited tasks
+                timeout = refresh_interval
+                next_moment = self.next_moment()
+                if next_moment is not None:
+                    timeout = min(timeout, max((next_moment - current).total_seconds(), 0))
+
+                with self._condition:
+                    if not self._subscribers:
+                        # under the same lock, so a new subscriber starts another thread
+                        self._thread = None
+                        return
+                    self._condition.wait(timeout)
+        finally:
+            with self._condition:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+            connections.close_all()
+
+
+scheduler = StatusScheduler()
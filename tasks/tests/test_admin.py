@@ -0,0 +1,108 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from datetime import datetime
+from django.utils.timezone import make_aware
+from ..admin import EstimatedCountPaginator
+from ..models import Owner, Task
+from .. import snapshot
+from ..snapshot import reset_snapshot
+
+
+class TaskAdminTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.owner = Owner.objects.create(name="John", surname="Smith")
+
+    def setUp(self):
+        reset_snapshot()
+        self.addCleanup(reset_snapshot)
+        self.client.login(username='admin', password='password')
+
+    def create_tree(self, name):
+        parent = Task.objects.create(name=name, owner=self.owner)
+        for day in ('01-01-2019', '05-01-2019'):
+            Task.objects.create(
+                name="{} {}".format(name, day),
+                owner=self.owner,
+                parent=parent,
+                start_date=make_aware(datetime.strptime(day, '%d-%m-%Y')),
+                end_date=make_aware(datetime.strptime('10-01-2019', '%d-%m-%Y')),
+            )
+
+    def get_changelist(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/tasks/task/")
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_changelist_queries_do_not_depend_on_rows(self):
+        self.create_tree("Task A")
+        response, queries = self.get_changelist()
+        self.assertContains(response, "Complete")
+        self.assertContains(response, "9 days")
+
+        self.create_tree("Task B")
+        self.create_tree("Task C")
+        _, more_queries = self.get_changelist()
+        self.assertEqual(queries, more_queries)
+
+    @override_settings(TASKS_SNAPSHOT=True, TASKS_SNAPSHOT_REFRESH=0)
+    def test_changelist_from_snapshot(self):
+        self.create_tree("Task A")
+        # the first load reads owners too
+        self.get_changelist()
+        self.create_tree("Task B")
+        response, queries = self.get_changelist()
+        self.assertContains(response, "9 days")
+        self.assertIsNotNone(snapshot._snapshot)
+
+        self.create_tree("Task C")
+        self.create_tree("Task D")
+        _, more_queries = self.get_changelist()
+        self.assertEqual(queries, more_queries)
+
+    def test_changelist_without_snapshot(self):
+        self.create_tree("Task A")
+        self.get_changelist()
+        self.assertIsNone(snapshot._snapshot)
+
+    def test_tasks_without_dates(self):
+        Task.objects.create(name="Task A")
+        Task.objects.create(name="Task B", parent=Task.objects.create(name="Task C"))
+        response, _ = self.get_changelist()
+        self.assertContains(response, "Task A")
+        with override_settings(TASKS_SNAPSHOT=True):
+            response, _ = self.get_changelist()
+        self.assertContains(response, "Task A")
+
+    def test_owner_autocomplete(self):
+        response = self.client.get("/admin/tasks/owner/autocomplete/", {'term': 'Smi'})
+        self.assertEqual(response.json()['results'][0]['text'], "John Smith")
+
+
+class EstimatedCountPaginatorTest(TestCase):
+
+    def test_estimated_count(self):
+        for number in range(3):
+            Task.objects.create(name="Task {}".format(number))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        Task.objects.create(name="Task not analyzed")
+
+        paginator = EstimatedCountPaginator(Task.objects.all(), 100)
+        paginator.estimate_threshold = 0
+        self.assertEqual(paginator.count, 3)
+
+    def test_exact_count_of_filtered_queryset(self):
+        for number in range(3):
+            Task.objects.create(name="Task {}".format(number))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        paginator = EstimatedCountPaginator(Task.objects.filter(name="Task 1"), 100)
+        paginator.estimate_threshold = 0
+        self.assertEqual(paginator.count, 1)
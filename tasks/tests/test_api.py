@@ -0,0 +1,183 @@
+import unittest
+from django.test import TestCase, override_settings
+from datetime import datetime, timedelta
+from django.utils.timezone import make_aware
+from ..api.renderers import msgpack
+from ..models import Owner, Task, TaskDeletion
+
+
+@override_settings(TASKS_SYNC_WINDOW=0)
+class TaskChangesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+
+        Task.objects.create(
+            name="Task A",
+            start_date=make_aware(datetime.strptime('20-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('22-01-2019', '%d-%m-%Y')),
+        )
+
+        task_b = Task.objects.create(
+            name="Task B",
+        )
+
+        Task.objects.create(
+            name="Task B 1",
+            parent=task_b,
+            start_date=make_aware(datetime.strptime('01-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('10-01-2019', '%d-%m-%Y')),
+        )
+
+    def test_full_sync_without_cursor(self):
+        response = self.client.get("/api/changes/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(task['id'] for task in response.json()['changed']), [1, 2, 3])
+        self.assertEqual(response.json()['deleted'], [])
+
+    def test_changes_since_cursor(self):
+        cursor = self.client.get("/api/changes/").json()['cursor']
+
+        task = Task.objects.get(id=1)
+        task.name = "Task A renamed"
+        task.save()
+
+        response = self.client.get("/api/changes/", {'since': cursor})
+        self.assertEqual(
+            [(task['id'], task['name']) for task in response.json()['changed']],
+            [(1, "Task A renamed")]
+        )
+        self.assertNotEqual(response.json()['cursor'], cursor)
+
+        response = self.client.get("/api/changes/", {'since': response.json()['cursor']})
+        self.assertEqual(response.json()['changed'], [])
+
+    def test_tombstones_of_deleted_tasks(self):
+        cursor = self.client.get("/api/changes/").json()['cursor']
+        Task.objects.get(id=2).delete()
+
+        response = self.client.get("/api/changes/", {'since': cursor})
+        self.assertEqual(sorted(response.json()['deleted']), [2, 3])
+        self.assertEqual(response.json()['changed'], [])
+
+    @override_settings(TASKS_SYNC_WINDOW=60)
+    def test_changes_committed_after_cursor(self):
+        response = self.client.get("/api/changes/")
+        # saved and deleted before the first request, committed after it
+        before = Task.objects.get(id=3).modified + timedelta(microseconds=1)
+        Task.objects.filter(id=1).update(name="Task A renamed", modified=before)
+        Task.objects.get(id=3).delete()
+        TaskDeletion.objects.update(deleted=before)
+
+        response = self.client.get("/api/changes/", {'since': response.json()['cursor']})
+        changed = {task['id']: task['name'] for task in response.json()['changed']}
+        self.assertEqual(changed[1], "Task A renamed")
+        self.assertEqual(response.json()['deleted'], [3])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/changes/", {'since': "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchivedTasksApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Task.objects.create(
+            name="Task A",
+            start_date=make_aware(datetime.strptime('20-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('22-01-2019', '%d-%m-%Y')),
+        )
+        Task.objects.create(
+            name="Task B",
+            start_date=make_aware(datetime.strptime('20-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('22-01-2119', '%d-%m-%Y')),
+        )
+        Task.objects.completed_roots().archive()
+
+    def test_list_of_active_tasks(self):
+        self.assertEqual([task['id'] for task in self.client.get("/api/").json()], [2])
+
+    def test_list_of_archived_tasks(self):
+        response = self.client.get("/api/", {'archived': 'true'})
+        self.assertEqual([task['name'] for task in response.json()], ["Task A"])
+
+    def test_archived_task_details(self):
+        self.assertEqual(self.client.get("/api/task/1/").status_code, 404)
+        response = self.client.get("/api/task/1/", {'archived': 'true'})
+        self.assertEqual(response.json()['priority'], "Normal")
+
+
+class TaskRenderersTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = Owner.objects.create(name="John", surname="Smith")
+        for day in ('01-01-2019', '02-01-2019', '03-01-2019'):
+            Task.objects.create(
+                name="Task {}".format(day),
+                owner=owner,
+                start_date=make_aware(datetime.strptime(day, '%d-%m-%Y')),
+                end_date=make_aware(datetime.strptime('10-01-2019', '%d-%m-%Y')),
+            )
+        Task.objects.create(name="Task without owner")
+
+    def test_columnar_list(self):
+        response = self.client.get("/api/", {'format': 'columnar'})
+        self.assertEqual(response['Content-Type'], 'application/vnd.tasks.columnar+json')
+
+        table = response.json()
+        self.assertEqual(table['count'], 4)
+        self.assertEqual(table['columns']['id'], [1, 2, 3, 4])
+        self.assertEqual(table['columns']['owner'], [0, 0, 0, None])
+        self.assertEqual(table['lookups']['owner'], [{'name': "John", 'surname': "Smith"}])
+        self.assertEqual(table['columns']['start_date'][:2], [1546300800, 1546387200])
+
+    def test_columnar_detail(self):
+        response = self.client.get("/api/task/2/", HTTP_ACCEPT='application/vnd.tasks.columnar+json')
+        self.assertEqual(response.json()['columns']['name'], ["Task 02-01-2019"])
+
+    def test_columnar_error(self):
+        response = self.client.get("/api/task/100/", {'format': 'columnar'})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', response.json())
+
+    @unittest.skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack_list(self):
+        response = self.client.get("/api/", HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        table = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual(table['columns']['name'][0], "Task 01-01-2019")
+
+    @override_settings(TASKS_GZIP_MIN_LENGTH=200)
+    def test_gzip_of_large_responses(self):
+        response = self.client.get("/api/", HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        response = self.client.get("/api/task/1/", HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class TaskMoveTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        parent = Task.objects.create(name="Task A")
+        for name in ("Task A 1", "Task A 2", "Task A 3"):
+            Task.objects.create(name=name, parent=parent)
+        Task.objects.create(name="Task B")
+
+    def test_move_after_sibling(self):
+        response = self.client.post("/api/task/4/move/", {'after': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['order_key'], Task.objects.get(id=4).order_key)
+        self.assertEqual(list(Task.objects.filter(parent_id=1).values_list('id', flat=True)), [2, 4, 3])
+
+    def test_move_to_the_end(self):
+        self.client.post("/api/task/2/move/")
+        self.assertEqual(list(Task.objects.filter(parent_id=1).values_list('id', flat=True)), [3, 4, 2])
+
+    def test_move_next_to_other_tasks(self):
+        self.assertEqual(self.client.post("/api/task/2/move/", {'before': 5}).status_code, 400)
+        self.assertEqual(self.client.post("/api/task/2/move/", {'after': 3, 'before': 4}).status_code, 400)
+        self.assertEqual(self.client.post("/api/task/100/move/").status_code, 404)
@@ -0,0 +1,199 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from datetime import datetime
+from django.utils.timezone import make_aware
+from ..datagen import generate_forest
+from ..management.commands.loadtest import percentile
+from ..models import ArchivedTask, Task, TaskDeletion
+from ..rollups import compute_rollups
+
+
+class RecomputeRollupsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+
+        Task.objects.create(
+            name="Task A",
+            start_date=make_aware(datetime.strptime('20-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('22-01-2019', '%d-%m-%Y')),
+        )
+
+        task_b = Task.objects.create(
+            name="Task B",
+        )
+
+        Task.objects.create(
+            name="Task B 1",
+            parent=task_b,
+            start_date=make_aware(datetime.strptime('01-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('10-01-2019', '%d-%m-%Y')),
+        )
+
+        task_b2 = Task.objects.create(
+            name="Task B 2",
+            parent=task_b,
+        )
+
+        Task.objects.create(
+            name="Task B 2a",
+            start_date=make_aware(datetime.strptime('01-03-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('10-03-2019', '%d-%m-%Y')),
+            parent=task_b2
+        )
+
+        Task.objects.create(
+            name="Task B 2b",
+            start_date=make_aware(datetime.strptime('05-03-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('15-03-2019', '%d-%m-%Y')),
+            parent=task_b2,
+        )
+
+    def break_rollups(self):
+        Task.objects.filter(id__in=[2, 4]).update(start_date=None, end_date=None)
+
+    def assertRollupsRepaired(self):
+        self.assertEqual(Task.objects.get(id=2).start_date, Task.objects.get(id=3).start_date)
+        self.assertEqual(Task.objects.get(id=2).end_date, Task.objects.get(id=6).end_date)
+        self.assertEqual(Task.objects.get(id=4).start_date, Task.objects.get(id=5).start_date)
+
+    def test_compute_rollups_of_consistent_tree(self):
+        rows = Task.objects.values_list('id', 'parent_id', 'start_date', 'end_date')
+        self.assertEqual(compute_rollups(list(rows)), [])
+
+    def test_rollups_ignore_undated_subtasks(self):
+        Task.objects.create(name="Task B 3", parent_id=2)
+        task = Task.objects.get(id=2)
+        self.assertEqual(task.start_date, Task.objects.get(id=3).start_date)
+        self.assertEqual(task.end_date, Task.objects.get(id=6).end_date)
+
+        rows = Task.objects.values_list('id', 'parent_id', 'start_date', 'end_date')
+        self.assertEqual(compute_rollups(list(rows)), [])
+
+    def test_recompute_rollups(self):
+        self.break_rollups()
+        call_command('recompute_rollups', workers=1, stdout=StringIO())
+        self.assertRollupsRepaired()
+
+    def test_recompute_rollups_in_process_pool(self):
+        self.break_rollups()
+        call_command('recompute_rollups', workers=2, chunk_size=1, stdout=StringIO())
+        self.assertRollupsRepaired()
+
+    def test_recompute_rollups_of_selected_roots(self):
+        self.break_rollups()
+        call_command('recompute_rollups', workers=1, roots=[1], stdout=StringIO())
+        self.assertIsNone(Task.objects.get(id=2).start_date)
+
+    def test_recompute_rollups_dry_run(self):
+        self.break_rollups()
+        out = StringIO()
+        call_command('recompute_rollups', workers=1, dry_run=True, stdout=out)
+        self.assertIn("Task 4: start_date None -> 2019-03-01", out.getvalue())
+        self.assertIn("2 tasks in 2 trees would be updated.", out.getvalue())
+        self.assertIsNone(Task.objects.get(id=2).start_date)
+
+
+class LoadTestTest(TestCase):
+
+    def test_generate_forest(self):
+        ids = generate_forest(roots=2, depth=2, fanout=3, seed=1)
+        self.assertEqual(len(ids), 2 * (1 + 3 + 9))
+        self.assertEqual(Task.objects.filter(parent=None).count(), 2)
+        rows = Task.objects.values_list('id', 'parent_id', 'start_date', 'end_date')
+        self.assertEqual(compute_rollups(list(rows)), [])
+
+    def test_percentile(self):
+        latencies = list(range(1, 101))
+        self.assertEqual(percentile(latencies, 50), 50)
+        self.assertEqual(percentile(latencies, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_loadtest_of_existing_tasks(self):
+        generate_forest(roots=1, depth=1, fanout=2, seed=1)
+        out = StringIO()
+        call_command(
+            'loadtest', existing=True, requests=10, concurrency=1, seed=1, host='testserver',
+            mix=['/api/=1', '/api/task/{pk}/=1'], stdout=out
+        )
+        self.assertIn("10 requests to 3 tasks", out.getvalue())
+        self.assertRegex(out.getvalue(), r"/api/task/\{pk\}/ +\d+ +0 ")
+
+    def test_loadtest_with_query_string(self):
+        generate_forest(roots=1, depth=1, fanout=2, seed=1)
+        out = StringIO()
+        call_command(
+            'loadtest', existing=True, requests=4, concurrency=1, seed=1, host='testserver',
+            mix=['/api/?format=columnar=1'], stdout=out
+        )
+        self.assertRegex(out.getvalue(), r"/api/\?format=columnar +4 +0 ")
+
+
+class ArchiveTasksTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+
+        Task.objects.create(
+            name="Task A",
+            start_date=make_aware(datetime.strptime('20-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('22-01-2019', '%d-%m-%Y')),
+        )
+
+        task_b = Task.objects.create(
+            name="Task B",
+        )
+
+        Task.objects.create(
+            name="Task B 1",
+            parent=task_b,
+            start_date=make_aware(datetime.strptime('01-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('10-01-2019', '%d-%m-%Y')),
+        )
+
+        Task.objects.create(
+            name="Task B 2",
+            parent=task_b,
+            start_date=make_aware(datetime.strptime('05-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('15-01-2019', '%d-%m-%Y')),
+        )
+
+        Task.objects.create(
+            name="Task C",
+            start_date=make_aware(datetime.strptime('01-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('01-01-2119', '%d-%m-%Y')),
+        )
+
+    def test_archive_completed_trees(self):
+        out = StringIO()
+        call_command('archive_tasks', stdout=out)
+        self.assertIn("Archived 2 trees.", out.getvalue())
+
+        self.assertEqual(list(Task.objects.values_list('id', flat=True)), [5])
+        self.assertEqual(
+            list(ArchivedTask.objects.values_list('id', 'parent_id', 'order')),
+            [(1, None, 1024), (2, None, 2048), (3, 2, 1024), (4, 2, 2048)]
+        )
+        self.assertEqual(sorted(TaskDeletion.objects.values_list('task_id', flat=True)), [1, 2, 3, 4])
+
+    def test_archive_older_than(self):
+        call_command('archive_tasks', older_than=(datetime.now() - datetime(2019, 1, 18)).days, stdout=StringIO())
+        self.assertEqual(list(ArchivedTask.objects.values_list('id', flat=True)), [2, 3, 4])
+
+    def test_archive_skips_trees_with_not_complete_tasks(self):
+        Task.objects.filter(id=4).update(end_date=make_aware(datetime.strptime('01-01-2119', '%d-%m-%Y')))
+        self.assertEqual(Task.objects.completed_roots().archive(), [1])
+
+    def test_archive_dry_run(self):
+        out = StringIO()
+        call_command('archive_tasks', dry_run=True, stdout=out)
+        self.assertIn("Trees which would be archived: 1, 2", out.getvalue())
+        self.assertEqual(ArchivedTask.objects.count(), 0)
+
+    def test_archive_dry_run_skips_trees_with_not_complete_tasks(self):
+        Task.objects.filter(id=4).update(end_date=None)
+        out = StringIO()
+        call_command('archive_tasks', dry_run=True, stdout=out)
+        self.assertIn("Trees which would be archived: 1\n", out.getvalue())
+        self.assertEqual(Task.objects.completed_roots().archive(), [1])
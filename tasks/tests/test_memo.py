@@ -0,0 +1,102 @@
+from django.test import TestCase
+from datetime import datetime
+from django.utils.timezone import make_aware
+from unittest import mock
+from ..memo import current_memo, invalidate_task_memo, task_memo
+from ..models import Task
+
+
+class TaskMemoTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        task_b = Task.objects.create(
+            name="Task B",
+        )
+
+        Task.objects.create(
+            name="Task B 1",
+            parent=task_b,
+            start_date=make_aware(datetime.strptime('01-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('10-01-2019', '%d-%m-%Y')),
+        )
+
+        task_b2 = Task.objects.create(
+            name="Task B 2",
+            parent=task_b,
+        )
+
+        Task.objects.create(
+            name="Task B 2a",
+            start_date=make_aware(datetime.strptime('01-03-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('10-03-2019', '%d-%m-%Y')),
+            parent=task_b2
+        )
+
+        Task.objects.create(
+            name="Task B 2b",
+            start_date=make_aware(datetime.strptime('05-03-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('15-03-2019', '%d-%m-%Y')),
+            parent=task_b2,
+        )
+
+    def test_memo_of_unit_of_work(self):
+        self.assertIsNone(current_memo())
+        with task_memo() as memo:
+            with task_memo() as nested_memo:
+                self.assertIs(nested_memo, memo)
+            self.assertIs(current_memo(), memo)
+        self.assertIsNone(current_memo())
+
+    @mock.patch('django.utils.timezone.now')
+    def test_properties_of_tree_are_read_with_query_per_level(self, now_mock):
+        now_mock.return_value = make_aware(datetime.strptime('06-03-2019', '%d-%m-%Y'))
+        with task_memo():
+            with self.assertNumQueries(4):
+                root = Task.objects.filter(parent=None).with_subtrees()[0]
+
+            with self.assertNumQueries(0):
+                self.assertEqual(root.status, 'Multi-Runs')
+                self.assertEqual(str(root.net_duration), '23 days, 0:00:00')
+                for task in root.children:
+                    self.assertEqual(task.parent, root)
+                    self.assertEqual(task.has_children, 0 if task.name == "Task B 1" else 2)
+
+    def test_values_of_subtrees_are_not_prefetched(self):
+        with task_memo():
+            with self.assertNumQueries(1):
+                ids = list(Task.objects.with_subtrees().values_list('id', flat=True))
+        self.assertEqual(sorted(ids), [1, 2, 3, 4, 5])
+
+    @mock.patch('django.utils.timezone.now')
+    def test_saved_tasks_invalidate_ancestors(self, now_mock):
+        now_mock.return_value = make_aware(datetime.strptime('06-03-2019', '%d-%m-%Y'))
+        with task_memo():
+            root = Task.objects.get(id=1)
+            self.assertEqual(root.status, 'Multi-Runs')
+
+            task = Task.objects.get(id=4)
+            task.end_date = make_aware(datetime.strptime('02-03-2019', '%d-%m-%Y'))
+            task.save()
+            self.assertEqual(root.status, 'Running')
+
+            Task.objects.get(id=5).delete()
+            self.assertEqual(root.status, 'Complete')
+            self.assertEqual(root.has_children, 2)
+
+    @mock.patch('django.utils.timezone.now')
+    def test_explicit_invalidation(self, now_mock):
+        now_mock.return_value = make_aware(datetime.strptime('06-03-2019', '%d-%m-%Y'))
+        with task_memo():
+            root = Task.objects.get(id=1)
+            self.assertEqual(root.status, 'Multi-Runs')
+
+            Task.objects.filter(id=5).update(start_date=make_aware(datetime.strptime('07-03-2019', '%d-%m-%Y')))
+            self.assertEqual(root.status, 'Multi-Runs')
+
+            invalidate_task_memo()
+            self.assertEqual(root.status, 'Running')
+
+    def test_main_page_queries_dont_depend_on_number_of_tasks(self):
+        with self.assertNumQueries(4):
+            self.client.get("/")
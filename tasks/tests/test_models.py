@@ -3,7 +3,7 @@ from datetime import datetime
 from django.utils.timezone import make_aware
 from unittest import mock
 from django.core.exceptions import ValidationError
-from ..models import Task
+from ..models import ORDER_GAP, Task
 
 
 class TaskModelTest(TestCase):
@@ -265,4 +265,58 @@ class TaskModelTest(TestCase):
             end_date=make_aware(datetime.strptime('22-03-2007', '%d-%m-%Y')),
             parent=parent_task
         )
-        self.assertEqual(str(parent_task.net_duration), '43 days, 0:00:00')
\ No newline at end of file
+        self.assertEqual(str(parent_task.net_duration), '43 days, 0:00:00')
+
+
+class TaskOrderTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        parent = Task.objects.create(name="Task A")
+        for name in ("Task A 1", "Task A 2", "Task A 3", "Task A 4"):
+            Task.objects.create(name=name, parent=parent)
+
+    def subtask_names(self):
+        return [task.name[-1] for task in Task.objects.get(id=1).subtasks.all()]
+
+    def test_new_tasks_are_last(self):
+        self.assertEqual(
+            list(Task.objects.filter(parent_id=1).values_list('order_key', flat=True)),
+            [ORDER_GAP, 2 * ORDER_GAP, 3 * ORDER_GAP, 4 * ORDER_GAP]
+        )
+        self.assertEqual(Task.objects.get(id=1).order_key, ORDER_GAP)
+
+    def test_move_updates_single_row(self):
+        task, sibling = Task.objects.get(id=5), Task.objects.get(id=2)
+        with self.assertNumQueries(3):
+            task.move(after=sibling)
+        self.assertEqual(self.subtask_names(), ['1', '4', '2', '3'])
+
+        Task.objects.get(id=4).move(before=Task.objects.get(id=2))
+        self.assertEqual(self.subtask_names(), ['3', '1', '4', '2'])
+
+        Task.objects.get(id=3).move(before=Task.objects.get(id=5))
+        self.assertEqual(self.subtask_names(), ['3', '1', '2', '4'])
+
+        Task.objects.get(id=4).move()
+        self.assertEqual(self.subtask_names(), ['1', '2', '4', '3'])
+
+    def test_keys_are_spread_out_when_gap_runs_out(self):
+        first = Task.objects.get(id=2)
+        expected = ['1', '2', '3', '4']
+        for move in range(12):
+            task = Task.objects.get(id=3 + move % 3)
+            task.move(after=first)
+            expected.remove(task.name[-1])
+            expected.insert(1, task.name[-1])
+            self.assertEqual(self.subtask_names(), expected)
+
+        self.assertEqual(Task.objects.get(id=2).order_key, ORDER_GAP)
+        keys = list(Task.objects.filter(parent_id=1).values_list('order_key', flat=True))
+        self.assertEqual(len(set(keys)), 4)
+
+    def test_move_next_to_other_tasks(self):
+        with self.assertRaises(ValueError):
+            Task.objects.get(id=2).move(after=Task.objects.get(id=1))
+        with self.assertRaises(ValueError):
+            Task.objects.get(id=2).move(after=Task.objects.get(id=3), before=Task.objects.get(id=4))
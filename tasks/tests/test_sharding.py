@@ -0,0 +1,145 @@
+from unittest import skipUnless
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from ..models import Owner, Task, TaskDeletion, TaskIdSequence
+from ..routers import TaskShardRouter
+from .. import sharding
+
+
+@override_settings(TASKS_SHARDS=['shard0', 'shard1', 'shard2'])
+class TaskShardRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = TaskShardRouter()
+
+    def test_root_task_shard(self):
+        self.assertEqual(self.router.db_for_write(Task, instance=Task(id=7)), 'shard0')
+        self.assertEqual(self.router.db_for_write(Task, instance=Task(id=8)), 'shard2')
+
+    def test_roots_of_equally_sized_trees_are_spread(self):
+        for tree_size in (4, 13, 40):
+            roots = [sharding.shard_for_root(1 + index * tree_size) for index in range(900)]
+            for alias in ('shard0', 'shard1', 'shard2'):
+                self.assertGreater(roots.count(alias), 250)
+
+    def test_sub_task_shard(self):
+        parent = Task(id=7)
+        parent._state.db = 'shard1'
+        self.assertEqual(self.router.db_for_write(Task, instance=Task(id=12, parent=parent)), 'shard1')
+
+    def test_related_objects_are_read_from_shard_of_instance(self):
+        task = Task(id=7)
+        task._state.db = 'shard2'
+        self.assertEqual(self.router.db_for_read(Task, instance=task), 'shard2')
+        self.assertEqual(self.router.db_for_read(Owner, instance=task), 'shard2')
+
+    def test_owners_are_written_to_default_database(self):
+        self.assertEqual(self.router.db_for_write(Owner), 'default')
+        self.assertEqual(sharding.owner_replicas('default'), ['shard0', 'shard1', 'shard2'])
+        self.assertEqual(sharding.owner_replicas('shard0'), [])
+
+    def test_id_sequence_is_migrated_only_in_default_database(self):
+        self.assertTrue(self.router.allow_migrate('default', 'tasks', 'taskidsequence'))
+        self.assertFalse(self.router.allow_migrate('shard0', 'tasks', 'taskidsequence'))
+        self.assertIsNone(self.router.allow_migrate('shard0', 'tasks', 'task'))
+        self.assertFalse(self.router.allow_migrate('shard0', 'auth', 'user'))
+
+    @override_settings(TASKS_SHARDS=[])
+    def test_router_without_shards(self):
+        self.assertIsNone(self.router.db_for_write(Task, instance=Task(id=7)))
+        self.assertIsNone(self.router.allow_migrate('default', 'tasks', 'taskidsequence'))
+
+
+@override_settings(TASKS_SHARDS=['default'], TASKS_ID_BLOCK_SIZE=2)
+class TaskIdAllocationTest(TestCase):
+
+    def setUp(self):
+        sharding._id_block.update({'next': 0, 'end': 0})
+        self.addCleanup(sharding._id_block.update, {'next': 0, 'end': 0})
+
+    def test_ids_are_reserved_in_blocks(self):
+        with override_settings(TASKS_SHARDS=[]):
+            Task.objects.create(name="Task A")
+            Task.objects.create(name="Task B")
+
+        task_c = Task.objects.create(name="Task C")
+        task_d = Task.objects.create(name="Task D", parent=task_c)
+        task_e = Task.objects.create(name="Task E")
+
+        self.assertEqual([task_c.id, task_d.id, task_e.id], [3, 4, 5])
+        self.assertEqual(TaskIdSequence.objects.get().next_id, 7)
+
+    def test_fan_out_list(self):
+        Task.objects.create(name="Task B")
+        Task.objects.create(name="Task A")
+        tasks = sharding.fan_out_list(Task.objects.order_by('name'))
+        self.assertEqual([task.name for task in tasks], ["Task A", "Task B"])
+        tasks = sharding.fan_out_list(Task.objects.order_by('-name'))
+        self.assertEqual([task.name for task in tasks], ["Task B", "Task A"])
+
+
+@skipUnless({'shard0', 'shard1'} <= set(settings.DATABASES), "Needs shard databases of task_app.settings_tests.")
+@override_settings(TASKS_SHARDS=['shard0', 'shard1'])
+class ShardedTaskTest(TransactionTestCase):
+    databases = {'default', 'shard0', 'shard1'}
+
+    def setUp(self):
+        sharding._id_block.update({'next': 0, 'end': 0})
+        self.addCleanup(sharding._id_block.update, {'next': 0, 'end': 0})
+
+    def create_roots(self):
+        roots = {}
+        while len(roots) < 2:
+            root = Task.objects.create(name="Task")
+            roots.setdefault(root._state.db, root)
+        return roots
+
+    def test_trees_are_spread_over_shards(self):
+        for _ in range(20):
+            root = Task.objects.create(name="Task")
+            for _ in range(3):
+                Task.objects.create(name="Sub task", parent=root)
+
+        for alias in ('shard0', 'shard1'):
+            roots = Task.objects.using(alias).filter(parent=None)
+            self.assertGreater(roots.count(), 4)
+            self.assertEqual(Task.objects.using(alias).count(), roots.count() * 4)
+
+    def test_shard_results_merged_by_ordering(self):
+        for _ in range(6):
+            root = Task.objects.create(name="Task")
+            Task.objects.create(name="Sub task", parent=root)
+
+        tasks = sharding.fan_out_list(Task.objects.all())
+        self.assertEqual(
+            [(task.order_key, task.id) for task in tasks],
+            sorted((task.order_key, task.id) for task in tasks),
+        )
+        self.assertEqual(len({task._state.db for task in tasks}), 2)
+
+    def test_task_moved_to_tree_in_another_shard(self):
+        roots = self.create_roots()
+        task = Task.objects.create(name="Task A", parent=roots['shard0'])
+        sub_task = Task.objects.create(name="Task A 1", parent=task)
+        created = Task.objects.using('shard0').get(id=sub_task.id).created
+
+        task.parent = roots['shard1']
+        task.save()
+
+        self.assertEqual(task._state.db, 'shard1')
+        moved = Task.objects.using('shard1').get(id=sub_task.id)
+        self.assertEqual((moved.parent_id, moved.created), (task.id, created))
+        self.assertFalse(Task.objects.using('shard0').filter(id__in=[task.id, sub_task.id]).exists())
+        self.assertFalse(TaskDeletion.objects.using('shard0').exists())
+
+    def test_sub_task_made_root_moved_to_shard_of_root(self):
+        root = Task.objects.create(name="Task")
+        task = Task.objects.create(name="Task A", parent=root)
+        while sharding.shard_for_root(task.id) == root._state.db:
+            task = Task.objects.create(name="Task A", parent=root)
+
+        task.parent = None
+        task.save()
+
+        self.assertEqual(task._state.db, sharding.shard_for_root(task.id))
+        self.assertEqual(sharding.find_task_database(task.id), task._state.db)
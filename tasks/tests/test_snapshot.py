@@ -0,0 +1,260 @@
+import gc
+import tracemalloc
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from datetime import datetime, timedelta
+from django.utils import timezone
+from django.utils.timezone import make_aware
+from unittest import mock
+from ..datagen import generate_forest
+from ..models import Owner, Task
+from ..snapshot import TaskSnapshot, reset_snapshot
+
+
+class TaskSnapshotTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+
+        Task.objects.create(
+            name="Task A",
+            start_date=make_aware(datetime.strptime('20-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('22-01-2019', '%d-%m-%Y')),
+        )
+
+        task_b = Task.objects.create(
+            name="Task B",
+        )
+
+        Task.objects.create(
+            name="Task B 1",
+            parent=task_b,
+            start_date=make_aware(datetime.strptime('01-01-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('10-01-2019', '%d-%m-%Y')),
+        )
+
+        task_b2 = Task.objects.create(
+            name="Task B 2",
+            parent=task_b,
+        )
+
+        Task.objects.create(
+            name="Task B 2a",
+            start_date=make_aware(datetime.strptime('01-03-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('10-03-2019', '%d-%m-%Y')),
+            parent=task_b2
+        )
+
+        Task.objects.create(
+            name="Task B 2b",
+            start_date=make_aware(datetime.strptime('05-03-2019', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('15-03-2019', '%d-%m-%Y')),
+            parent=task_b2,
+        )
+
+    def setUp(self):
+        self.snapshot = TaskSnapshot()
+        self.snapshot.refresh()
+
+    def test_children_index(self):
+        self.assertEqual([node.id for node in self.snapshot.roots()], [1, 2])
+        self.assertEqual([node.id for node in self.snapshot.get(2).children], [3, 4])
+        self.assertEqual(self.snapshot.get(5).parent.id, 4)
+        self.assertFalse(self.snapshot.get(1).has_children)
+
+    def test_statuses_match_model(self):
+        for day in ('30-12-2018', '05-01-2019', '07-02-2019', '07-03-2019', '07-10-2019'):
+            current = make_aware(datetime.strptime(day, '%d-%m-%Y'))
+            with mock.patch('django.utils.timezone.now', return_value=current):
+                for task in Task.objects.all():
+                    self.assertEqual(self.snapshot.get(task.id).status, task.status)
+
+    def test_net_duration_matches_model(self):
+        for task in Task.objects.all():
+            self.assertEqual(self.snapshot.get(task.id).net_duration, task.net_duration)
+
+    def test_incremental_refresh(self):
+        task = Task.objects.create(
+            name="Task B 3",
+            start_date=make_aware(datetime.strptime('02-03-2007', '%d-%m-%Y')),
+            end_date=make_aware(datetime.strptime('22-03-2007', '%d-%m-%Y')),
+            parent_id=2
+        )
+        self.assertEqual(self.snapshot.refresh(), 2)
+        self.assertEqual([node.id for node in self.snapshot.get(2).children], [3, 4, task.id])
+        self.assertEqual(self.snapshot.get(2).start_date, task.start_date)
+        self.assertEqual(str(self.snapshot.get(2).net_duration), '43 days, 0:00:00')
+
+    def test_refresh_doesnt_change_indexes_of_readers(self):
+        nodes, children = self.snapshot.nodes, self.snapshot.get(2).children
+        task = Task.objects.get(id=3)
+        task.name = "Task B 1 renamed"
+        task.save()
+        Task.objects.get(id=4).delete()
+        self.snapshot.refresh()
+
+        self.assertEqual([node.id for node in children], [3, 4])
+        self.assertEqual(nodes[3].name, "Task B 1")
+        self.assertIn(5, nodes)
+        self.assertEqual([node.name for node in self.snapshot.get(2).children], ["Task B 1 renamed"])
+
+    def test_refresh_matches_full_load(self):
+        Task.objects.filter(id=5).update(parent_id=1, modified=timezone.now())
+        Task.objects.create(name="Task B 0", parent_id=2, order_key=-1)
+        Task.objects.get(id=3).delete()
+        self.snapshot.refresh()
+
+        loaded = TaskSnapshot()
+        loaded.refresh()
+        self.assertEqual(list(self.snapshot.nodes), list(loaded.nodes))
+        self.assertEqual(
+            {parent_id: [node.id for node in nodes] for parent_id, nodes in self.snapshot.children.items()},
+            {parent_id: [node.id for node in nodes] for parent_id, nodes in loaded.children.items()},
+        )
+
+    def test_all_in_default_ordering(self):
+        self.assertEqual(
+            [node.id for node in self.snapshot.all()],
+            [task.id for task in Task.objects.all()]
+        )
+        self.assertNotEqual([node.id for node in self.snapshot.all()], sorted(self.snapshot.nodes))
+
+    def test_refresh_without_changes(self):
+        version = self.snapshot.version
+        for _ in range(3):
+            self.assertEqual(self.snapshot.refresh(), 0)
+        self.assertEqual(self.snapshot.version, version)
+
+    def test_refresh_reads_rows_committed_late(self):
+        # saved before the last refresh, committed after it
+        modified = self.snapshot.get(1).modified + timedelta(microseconds=1)
+        self.assertLess(modified, self.snapshot.high_water)
+        Task.objects.filter(id=1).update(name="Task A renamed", modified=modified)
+        task = Task.objects.create(name="Task C")
+        Task.objects.filter(id=task.id).update(modified=modified)
+
+        self.assertEqual(self.snapshot.refresh(), 2)
+        self.assertEqual(self.snapshot.get(1).name, "Task A renamed")
+        self.assertEqual([node.id for node in self.snapshot.roots()], [1, 2, task.id])
+
+    @override_settings(TASKS_SYNC_WINDOW=0)
+    def test_refresh_without_window_misses_rows_committed_late(self):
+        modified = self.snapshot.get(1).modified + timedelta(microseconds=1)
+        Task.objects.filter(id=1).update(name="Task A renamed", modified=modified)
+        self.assertEqual(self.snapshot.refresh(), 0)
+
+    def test_refresh_drops_deleted_tasks(self):
+        Task.objects.get(id=4).delete()
+        self.snapshot.refresh()
+        self.assertIsNone(self.snapshot.get(4))
+        self.assertIsNone(self.snapshot.get(5))
+        self.assertEqual([node.id for node in self.snapshot.get(2).children], [3])
+
+    def test_failed_refresh_is_repeated_in_full(self):
+        snapshot = TaskSnapshot()
+        with mock.patch('tasks.snapshot.Owner.objects.in_bulk', side_effect=OperationalError("database is locked")):
+            with self.assertRaises(OperationalError):
+                snapshot.refresh()
+        self.assertIsNone(snapshot.high_water)
+
+        with override_settings(TASKS_SYNC_WINDOW=0):
+            Task.objects.filter(id=1).update(modified=self.snapshot.high_water + timedelta(seconds=1))
+            self.assertEqual(snapshot.refresh(), 6)
+        self.assertEqual(len(snapshot.nodes), 6)
+
+    def test_refresh_reads_owners(self):
+        owner = Owner.objects.create(name="John", surname="Smith")
+        Task.objects.filter(id=1).update(owner=owner)
+        Task.objects.filter(id=1).update(modified=self.snapshot.get(1).modified + timedelta(microseconds=1))
+        self.snapshot.refresh()
+        self.assertEqual(str(self.snapshot.get(1).owner), "John Smith")
+
+        owner.name = "Jane"
+        owner.save()
+        self.assertEqual(self.snapshot.refresh(), 0)
+        self.assertEqual(str(self.snapshot.get(1).owner), "Jane Smith")
+
+        owners = self.snapshot.owners
+        self.snapshot.refresh()
+        self.assertIs(self.snapshot.owners, owners)
+
+        owner.delete()
+        self.snapshot.refresh()
+        self.assertEqual(self.snapshot.owners, {})
+
+    def test_refresh_if_due(self):
+        snapshot = TaskSnapshot()
+        snapshot.refresh_if_due(60)
+        self.assertEqual(len(snapshot.nodes), 6)
+
+        Task.objects.create(name="Task C")
+        with self.assertNumQueries(0):
+            snapshot.refresh_if_due(60)
+        self.assertEqual(len(snapshot.nodes), 6)
+        snapshot.refresh_if_due(0)
+        self.assertEqual(len(snapshot.nodes), 7)
+
+    def test_readers_dont_wait_for_refresh(self):
+        snapshot = TaskSnapshot()
+        snapshot.refresh()
+        Task.objects.create(name="Task C")
+        with snapshot._lock, self.assertNumQueries(0):
+            # another thread is refreshing
+            snapshot.refresh_if_due(0)
+        self.assertEqual(len(snapshot.nodes), 6)
+
+    def test_compaction_keeps_nodes_of_readers(self):
+        nodes = self.snapshot.nodes
+        task = Task.objects.get(id=3)
+        with mock.patch('tasks.snapshot.COMPACT_MIN_ROWS', 0):
+            # every save adds rows of the task and its parent
+            for number in range(4):
+                task.name = "Task B 1 renamed {}".format(number)
+                task.save()
+                self.snapshot.refresh()
+
+        self.assertEqual(len(self.snapshot._columns), 6)
+        self.assertEqual((nodes[3].name, nodes[3].start_date), ("Task B 1", task.start_date))
+        self.assertEqual(self.snapshot.get(3).name, "Task B 1 renamed 3")
+        self.assertEqual([node.id for node in self.snapshot.get(2).children], [3, 4])
+        self.assertEqual(self.snapshot.get(2).net_duration, Task.objects.get(id=2).net_duration)
+
+    @override_settings(TASKS_SNAPSHOT=True)
+    def test_views_served_from_snapshot(self):
+        reset_snapshot()
+        self.addCleanup(reset_snapshot)
+
+        self.assertEqual(self.client.get("/").status_code, 200)
+        response = self.client.get("/api/task/5/")
+        self.assertEqual(response.json()['name'], "Task B 2a")
+        self.assertEqual(len(self.client.get("/api/").json()), 6)
+        self.assertEqual(self.client.get("/api/task/100/").status_code, 404)
+
+
+class TaskSnapshotFootprintTest(TestCase):
+
+    def allocated(self, load):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            loaded = load()
+            gc.collect()
+            return loaded, tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+    def load_snapshot(self):
+        snapshot = TaskSnapshot()
+        snapshot.refresh()
+        return snapshot
+
+    def test_snapshot_is_smaller_than_model_instances(self):
+        generate_forest(roots=50, depth=3, fanout=3, seed=1)
+        # the first load of each kind warms up caches of the ORM
+        self.load_snapshot()
+        list(Task.objects.all())
+
+        tasks, tasks_size = self.allocated(lambda: list(Task.objects.all()))
+        snapshot, snapshot_size = self.allocated(self.load_snapshot)
+        self.assertEqual(len(snapshot.nodes), len(tasks))
+        self.assertGreater(tasks_size / snapshot_size, 4)
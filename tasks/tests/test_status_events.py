@@ -0,0 +1,179 @@
+import threading
+from django.test import TestCase, override_settings
+from datetime import datetime, timedelta
+from django.utils.timezone import make_aware
+from unittest import mock
+from ..models import Task
+from ..snapshot import TaskSnapshot
+from ..status_events import StatusScheduler, scheduler
+
+
+def moment(day):
+    return make_aware(datetime.strptime(day, '%d-%m-%Y'))
+
+
+class StatusSchedulerTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+
+        Task.objects.create(
+            name="Task A",
+            start_date=moment('20-01-2019'),
+            end_date=moment('22-01-2019'),
+        )
+
+        task_b = Task.objects.create(
+            name="Task B",
+        )
+
+        Task.objects.create(
+            name="Task B 1",
+            parent=task_b,
+            start_date=moment('01-01-2019'),
+            end_date=moment('10-01-2019'),
+        )
+
+        task_b2 = Task.objects.create(
+            name="Task B 2",
+            parent=task_b,
+        )
+
+        Task.objects.create(
+            name="Task B 2a",
+            start_date=moment('01-03-2019'),
+            end_date=moment('10-03-2019'),
+            parent=task_b2
+        )
+
+        Task.objects.create(
+            name="Task B 2b",
+            start_date=moment('05-03-2019'),
+            end_date=moment('15-03-2019'),
+            parent=task_b2,
+        )
+
+    def setUp(self):
+        self.snapshot = TaskSnapshot()
+        self.snapshot.refresh()
+        self.scheduler = StatusScheduler()
+
+    def test_first_advance_sets_baseline(self):
+        self.assertEqual(self.scheduler.advance(moment('05-01-2019'), self.snapshot), [])
+        self.assertEqual(self.scheduler.flags[2], 'R')
+        self.assertEqual(self.scheduler.next_moment(), moment('10-01-2019') + timedelta(microseconds=1))
+
+    def test_advance_publishes_only_changed_tasks(self):
+        self.scheduler.advance(moment('05-01-2019'), self.snapshot)
+        self.assertEqual(
+            self.scheduler.advance(moment('07-02-2019'), self.snapshot),
+            [{'id': 1, 'status': 'Complete'},
+             {'id': 2, 'status': 'Idle'},
+             {'id': 3, 'status': 'Complete'}]
+        )
+        self.assertEqual(
+            self.scheduler.advance(moment('07-03-2019'), self.snapshot),
+            [{'id': 2, 'status': 'Multi-Runs'},
+             {'id': 4, 'status': 'Multi-Runs'},
+             {'id': 5, 'status': 'Running'},
+             {'id': 6, 'status': 'Running'}]
+        )
+        self.assertEqual(self.scheduler.advance(moment('08-03-2019'), self.snapshot), [])
+
+    def test_unchanged_snapshot_uses_timer_heap(self):
+        self.scheduler.advance(moment('05-01-2019'), self.snapshot)
+        self.snapshot.refresh()
+        with mock.patch.object(self.scheduler, '_rebuild') as rebuild:
+            self.assertEqual(
+                [change['id'] for change in self.scheduler.advance(moment('07-02-2019'), self.snapshot)],
+                [1, 2, 3]
+            )
+        rebuild.assert_not_called()
+
+    def test_advance_after_tasks_changed(self):
+        self.scheduler.advance(moment('07-02-2019'), self.snapshot)
+        Task.objects.create(
+            name="Task B 3",
+            start_date=moment('01-02-2019'),
+            end_date=moment('10-02-2019'),
+            parent_id=2
+        )
+        self.snapshot.refresh()
+        self.assertEqual(
+            self.scheduler.advance(moment('07-02-2019'), self.snapshot),
+            [{'id': 2, 'status': 'Running'},
+             {'id': 7, 'status': 'Running'}]
+        )
+
+    def test_first_dated_task_is_published(self):
+        Task.objects.all().delete()
+        self.snapshot.refresh()
+        self.assertEqual(self.scheduler.advance(moment('05-01-2019'), self.snapshot), [])
+
+        task = Task.objects.create(name="Task C", start_date=moment('01-01-2019'), end_date=moment('10-01-2019'))
+        self.snapshot.refresh()
+        self.assertEqual(
+            self.scheduler.advance(moment('05-01-2019'), self.snapshot),
+            [{'id': task.id, 'status': 'Running'}]
+        )
+
+    @override_settings(TASKS_STATUS_STREAM_REFRESH=0)
+    def test_scheduler_thread_survives_errors(self):
+        with mock.patch.object(self.scheduler, '_ensure_running'):
+            events = self.scheduler.subscribe()
+        calls = []
+
+        def advance(current):
+            calls.append(current)
+            if len(calls) == 1:
+                raise ValueError("broken snapshot")
+            self.scheduler.unsubscribe(events)
+            return [{'id': 1, 'status': 'Running'}]
+
+        with mock.patch.object(self.scheduler, 'advance', side_effect=advance), \
+                mock.patch('tasks.status_events.connections'), \
+                self.assertLogs('tasks.status_events', 'ERROR'):
+            self.scheduler._run()
+        self.assertEqual(len(calls), 2)
+
+    def test_stream(self):
+        with mock.patch.object(scheduler, '_ensure_running'):
+            response = self.client.get("/api/statuses/stream/")
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+            content = iter(response.streaming_content)
+            self.assertEqual(next(content), b"retry: 5000\n\n")
+            scheduler.publish([{'id': 1, 'status': 'Running'}])
+            self.assertEqual(
+                next(content),
+                b'event: status\ndata: [{"id": 1, "status": "Running"}]\n\n'
+            )
+            response.close()
+            self.assertEqual(scheduler._subscribers, set())
+
+    def test_stream_closed_before_first_event(self):
+        with mock.patch.object(scheduler, '_ensure_running'):
+            response = self.client.get("/api/statuses/stream/")
+            response.close()
+        self.assertEqual(scheduler._subscribers, set())
+
+    def test_subscriber_right_after_thread_stops_starts_new_thread(self):
+        status_scheduler = self.scheduler
+        status_scheduler._thread = threading.current_thread()
+        running_threads = []
+
+        class Condition(threading.Condition):
+
+            def __exit__(self, *args):
+                super().__exit__(*args)
+                if not status_scheduler._subscribers and not running_threads:
+                    # a client subscribing as soon as the thread has found no subscribers
+                    with mock.patch.object(status_scheduler, '_ensure_running',
+                                           side_effect=lambda: running_threads.append(status_scheduler._thread)):
+                        status_scheduler.subscribe()
+
+        status_scheduler._condition = Condition()
+        with mock.patch.object(status_scheduler, 'advance', return_value=[]), \
+                mock.patch('tasks.status_events.connections'):
+            status_scheduler._run()
+        self.assertEqual(running_threads, [None])
@@ -1,10 +1,16 @@
 from django.views import generic
+from .memo import prefetch_subtrees
 from .models import Task
+from .sharding import fan_out_list
+from .snapshot import get_snapshot, snapshot_enabled
 from django.shortcuts import get_list_or_404
 
 
 class TaskListView(generic.ListView):
     model = Task
+    template_name = "tasks/task_list.html"
 
     def get_queryset(self):
-        return Task.objects.filter(parent=None)
\ No newline at end of file
+        if snapshot_enabled():
+            return get_snapshot().roots()
+        return prefetch_subtrees(fan_out_list(Task.objects.filter(parent=None)))
\ No newline at end of file